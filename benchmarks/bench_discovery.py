@@ -0,0 +1,126 @@
+"""Wall time, PVE requests and memory of discovery against a simulated PVE.
+
+Each cycle runs Discovery.discovery() of a Scheduler against benchmarks.pve_sim, the last
+snapshot is then served over HTTP to measure /targets throughput. Run from
+the repository root:
+
+    python -m benchmarks.bench_discovery --nodes 10 --guests 300 --latency 2
+"""
+
+import argparse
+import logging
+import multiprocessing
+import sys
+import time
+import tracemalloc
+
+from loguru import logger
+
+from benchmarks.bench_http import client, start_server
+from benchmarks.pve_sim import SimulatedPVE
+from pphsd.config import Config
+from pphsd.scheduler import Scheduler
+from pphsd.server import create_app
+from pphsd.snapshot import Snapshot
+
+
+def parse_latency(values: list[str], default: float) -> dict[str, float]:
+    latency = {"*": default / 1000}
+    for value in values:
+        kind, _, milliseconds = value.partition("=")
+        latency[kind] = float(milliseconds) / 1000
+    return latency
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=5)
+    parser.add_argument("--guests", type=int, default=200, help="guests per node")
+    parser.add_argument("--latency", type=float, default=2.0, help="ms per request")
+    parser.add_argument(
+        "--latency-for",
+        action="append",
+        default=[],
+        metavar="KIND=MS",
+        help="latency of nodes, guests, config, agent or cluster requests",
+    )
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-delay", type=float, default=1.0)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--per-node", type=int, default=4)
+    parser.add_argument("--inventory-mode", choices=["nodes", "cluster"])
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--http-duration", type=float, default=3.0)
+    parser.add_argument("--http-clients", type=int, default=8)
+    args = parser.parse_args()
+    if args.cycles < 1:
+        parser.error("--cycles must be at least 1")
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    logging.getLogger("waitress").setLevel(logging.CRITICAL)
+
+    pve = SimulatedPVE(
+        nodes=args.nodes,
+        guests=args.guests,
+        latency=parse_latency(args.latency_for, args.latency),
+        failure_rate=args.failure_rate,
+        timeout_rate=args.timeout_rate,
+        timeout_delay=args.timeout_delay,
+    )
+    config = Config.model_validate(
+        {
+            "pve_config": {
+                "server": "pve.invalid",
+                "user": "bench@pve",
+                "token_name": "bench",
+                "token_value": "secret",
+                # failures are what is measured, not hidden behind backoff
+                "retry_backoff": 0.0,
+            },
+            "max_workers": args.workers,
+            "max_requests_per_node": args.per_node,
+            "inventory_mode": args.inventory_mode or "nodes",
+            "incremental": args.incremental,
+        }
+    )
+    scheduler = Scheduler(config)
+    discovery = scheduler.discoveries[0]
+    pve.attach(discovery.client)
+
+    print(f"guests:     {pve.guest_count} on {args.nodes} nodes")
+    hosts = discovery.hosts
+    for cycle in range(args.cycles):
+        before = sum(pve.requests.values())
+        # only the first cycle is traced, tracing slows everything down
+        if cycle == 0:
+            tracemalloc.start()
+        start = time.perf_counter()
+        hosts = discovery.discovery()
+        elapsed = time.perf_counter() - start
+        if cycle == 0:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        requests = sum(pve.requests.values()) - before
+        print(
+            f"cycle {cycle}:    {elapsed * 1000:.0f} ms, {requests} requests, "
+            f"{len(hosts)} hosts"
+        )
+    print(f"peak:       {peak / 1024 / 1024:.2f} MiB in cycle 0 (traced)")
+    print(f"requests:   {dict(sorted(pve.requests.items()))}")
+
+    scheduler.snapshot = Snapshot.from_hosts(hosts)
+    port, stop = start_server("waitress", create_app(config, scheduler), 8)
+    deadline = time.perf_counter() + args.http_duration
+    with multiprocessing.Pool(args.http_clients) as pool:
+        results = pool.starmap(
+            client, [(port, deadline, {}) for _ in range(args.http_clients)]
+        )
+    stop()
+    served = sum(len(result) for result in results)
+    print(f"/targets:   {served / args.http_duration:.0f} rps")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Time and memory needed to build and serialize an inventory of N hosts.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_hosts --hosts 10000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from pphsd.model import Host, Hosts
+
+
+def build(count: int) -> Hosts:
+    hosts = Hosts([])
+    for vmid in range(100, 100 + count):
+        host = Host(
+            hostname=f"guest-{vmid}",
+            ipv4_address=f"10.{vmid >> 16 & 255}.{vmid >> 8 & 255}.{vmid & 255}",
+            ipv6_address="",
+            vmid=vmid,
+            pve_type="qemu" if vmid % 2 else "container",
+            labels={},
+            node=f"pve{vmid % 8}",
+            status="running",
+        )
+        host.add_label("cpu", 1)
+        host.add_label("cores", 2)
+        host.add_label("memory", 2048)
+        host.add_label("status", "running")
+        host.add_label("tags", "prod;web")
+        hosts.add_host(host)
+    return hosts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        hosts = build(args.hosts)
+        [host.to_sd_json() for host in hosts]
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    hosts = build(args.hosts)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"hosts:       {len(hosts)}")
+    print(f"build+json:  {min(timings) * 1000:.1f} ms (best of {args.rounds})")
+    print(f"retained:    {current / 1024 / 1024:.2f} MiB")
+    print(f"peak:        {peak / 1024 / 1024:.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
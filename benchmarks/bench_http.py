@@ -0,0 +1,96 @@
+"""Requests per second and latency of /targets under concurrent keep-alive load.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_http --server waitress --clients 16 --hosts 3000
+"""
+
+import argparse
+import http.client
+import logging
+import multiprocessing
+import statistics
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable
+from urllib.parse import parse_qsl
+
+from benchmarks.bench_hosts import build
+from pphsd.config import Config
+from pphsd.server import create_app
+from pphsd.snapshot import Snapshot
+
+
+def start_server(name: str, app: Any, threads: int) -> tuple[int, Callable[[], None]]:
+    if name == "waitress":
+        import waitress
+
+        server = waitress.create_server(app, host="127.0.0.1", port=0, threads=threads)
+        threading.Thread(target=server.run, daemon=True).start()
+        return server.effective_port, server.close
+    from werkzeug.serving import make_server
+
+    dev_server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=dev_server.serve_forever, daemon=True).start()
+    return dev_server.port, dev_server.shutdown
+
+
+def client(
+    port: int, deadline: float, headers: dict[str, str], path: str = "/targets"
+) -> list[float]:
+    latencies = []
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=["waitress", "flask"], default="waitress")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--hosts", type=int, default=3000)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument(
+        "--query", default="", help="selectors, e.g. node=pve1&type=qemu"
+    )
+    args = parser.parse_args()
+    logging.getLogger("waitress").setLevel(logging.CRITICAL)
+
+    discovery = SimpleNamespace(snapshot=Snapshot.from_hosts(build(args.hosts)))
+    app = create_app(Config(), discovery)  # type: ignore[arg-type]
+    port, stop = start_server(args.server, app, args.threads)
+    headers = {"Accept-Encoding": "gzip"} if args.gzip else {}
+    path = f"/targets?{args.query}" if args.query else "/targets"
+
+    # clients run in their own processes so they do not compete with the
+    # server for the GIL
+    deadline = time.perf_counter() + args.duration
+    with multiprocessing.Pool(args.clients) as pool:
+        results = pool.starmap(
+            client,
+            [(port, deadline, headers, path) for _ in range(args.clients)],
+        )
+    stop()
+
+    latencies = sorted(latency for result in results for latency in result)
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"server:   {args.server} ({args.threads} threads)")
+    view = discovery.snapshot.view(**dict(parse_qsl(args.query)))
+    print(f"payload:  {len(view.payload) / 1024:.0f} KiB of {args.hosts} hosts")
+    print(f"requests: {len(latencies)} from {args.clients} keep-alive clients")
+    print(f"rps:      {len(latencies) / args.duration:.0f}")
+    print(f"p50:      {quantiles[49] * 1000:.2f} ms")
+    print(f"p99:      {quantiles[98] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
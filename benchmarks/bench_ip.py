@@ -0,0 +1,83 @@
+"""Time needed to extract the addresses of N guests from config and agent data.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ip --guests 10000 --nics 4
+"""
+
+import argparse
+import time
+from itertools import chain
+
+from pphsd.addresses import AddressSelector, agent_addresses, config_addresses
+from pphsd.pve_model import NetworkInterfaceConfig
+
+
+def guest_config(vmid: int, nics: int) -> dict[str, str]:
+    config = {"name": f"guest-{vmid}", "memory": "2048", "description": "x" * 200}
+    for index in range(nics):
+        config[f"net{index}"] = (
+            f"name=eth{index},bridge=vmbr{index},hwaddr=BC:24:11:00:{index:02X}:01,"
+            f"ip=10.{index}.{vmid >> 8 & 255}.{vmid & 255}/16,gw=10.{index}.0.1,"
+            f"ip6=fd00:{index}::{vmid:x}/64,type=veth"
+        )
+    return config
+
+
+def agent_networks(vmid: int, nics: int) -> list[NetworkInterfaceConfig]:
+    networks = [("lo", ["127.0.0.1", "::1"])] + [
+        (f"eth{index}", [f"10.{index}.0.{vmid & 255}", f"fe80::{vmid:x}"])
+        for index in range(nics)
+    ]
+    return [
+        NetworkInterfaceConfig.model_validate(
+            {
+                "name": name,
+                "hardware-address": None,
+                "statistics": None,
+                "ip-addresses": [
+                    {
+                        "prefix": 64 if ":" in address else 24,
+                        "ip-address-type": "ipv6" if ":" in address else "ipv4",
+                        "ip-address": address,
+                    }
+                    for address in addresses
+                ],
+            }
+        )
+        for name, addresses in networks
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guests", type=int, default=10000)
+    parser.add_argument("--nics", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    configs = [guest_config(vmid, args.nics) for vmid in range(args.guests)]
+    networks = [agent_networks(vmid, args.nics) for vmid in range(args.guests)]
+    selectors = {
+        "default": AddressSelector(),
+        "preferred": AddressSelector(interfaces=(f"eth{args.nics - 1}",)),
+    }
+
+    print(f"guests:      {args.guests} with {args.nics} nics")
+    for name, selector in selectors.items():
+        for source in ("config", "agent+config"):
+            timings = []
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                for config, guest_networks in zip(configs, networks):
+                    addresses = config_addresses(config)
+                    if source != "config":
+                        addresses = chain(agent_addresses(guest_networks), addresses)
+                    selector.select(addresses)
+                timings.append(time.perf_counter() - start)
+            per_guest = min(timings) / args.guests * 1e6
+            print(f"{name + ' ' + source + ':':<26}{per_guest:.1f} µs per guest")
+
+
+if __name__ == "__main__":
+    main()
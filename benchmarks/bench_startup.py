@@ -0,0 +1,130 @@
+"""Import time of the entry point and time until the http mode is listening.
+
+Fails when the median import time exceeds the budget, or when modules only
+the http mode needs are imported up front. Run from the repository root:
+
+    python -m benchmarks.bench_startup --budget 600
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINT = "pphsd.cli"
+# only imported once the http mode starts serving
+HTTP_ONLY = ("flask", "werkzeug", "waitress")
+
+
+def import_times(module: str) -> dict[str, tuple[int, int]]:
+    """Self and cumulative import time in µs of module and its direct imports."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        # the top-level module is not indented, its direct imports by 2
+        name = name.removeprefix(" ")
+        if name == module or (name.startswith("  ") and not name.startswith("   ")):
+            times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def loaded_modules(module: str, candidates: tuple[str, ...]) -> list[str]:
+    code = (
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {candidates!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return output.split()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_listen(timeout: float) -> float:
+    """Seconds from process start until the http mode accepts connections.
+
+    PVE points at a closed port, the server has to listen without it.
+    """
+    port = free_port()
+    env = {
+        **os.environ,
+        "PROMETHEUS_PVE_HTTP_SD_HTTP_ADDRESS": "127.0.0.1",
+        "PROMETHEUS_PVE_HTTP_SD_HTTP_PORT": str(port),
+        "PROMETHEUS_PVE_HTTP_SD_METRICS_ENABLED": "false",
+        "PROMETHEUS_PVE_HTTP_SD_PVE_SERVER": "127.0.0.1:9",
+        "PROMETHEUS_PVE_HTTP_SD_PVE_USER": "bench@pve",
+    }
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", ENTRY_POINT, "-m", "http"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"{ENTRY_POINT} exited with {process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            except OSError:
+                time.sleep(0.005)
+                continue
+            return time.perf_counter() - start
+        raise RuntimeError(f"not listening after {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget", type=float, default=600, help="ms allowed for the import"
+    )
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    runs = [import_times(ENTRY_POINT) for _ in range(args.runs)]
+    median = statistics.median(run[ENTRY_POINT][1] for run in runs) / 1000
+    heaviest = sorted(
+        ((name, cumulative) for name, (_, cumulative) in runs[-1].items()),
+        key=lambda item: -item[1],
+    )
+    print(f"import {ENTRY_POINT}: {median:.0f} ms (median of {args.runs})")
+    for name, cumulative in heaviest[1 : args.top + 1]:
+        print(f"  {name:<24}{cumulative / 1000:>7.1f} ms")
+
+    listen = statistics.median(time_to_listen(30.0) for _ in range(args.runs))
+    print(f"http listening after: {listen * 1000:.0f} ms (median of {args.runs})")
+
+    failures = []
+    if median > args.budget:
+        failures.append(f"import took {median:.0f} ms, budget is {args.budget:.0f} ms")
+    eager = loaded_modules(ENTRY_POINT, HTTP_ONLY)
+    if eager:
+        failures.append(f"http-only modules imported up front: {', '.join(eager)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""A simulated PVE API served from memory through a requests transport adapter.
+
+The adapter is mounted on the session of a ProxmoxClient, so discovery runs
+unchanged against synthetic nodes and guests without a network or server:
+
+    pve = SimulatedPVE(nodes=10, guests=200, latency={"config": 0.005})
+    client = ProxmoxClient(config)
+    pve.attach(client)
+
+Use API token credentials in the config, password auth posts to the real
+server for a ticket before the adapter can be mounted.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Mapping
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from pphsd.client import ProxmoxClient
+
+API_ROOT = "/api2/json/"
+
+
+class SimulatedPVE(BaseAdapter):
+    """Synthetic cluster of nodes x guests with latency and failure knobs.
+
+    latency maps endpoint kinds (nodes, guests, config, agent, cluster,
+    pools) to seconds, "*" applies to all others. failure_rate answers a
+    request with 503, timeout_rate lets it time out after timeout_delay.
+    """
+
+    def __init__(
+        self,
+        nodes: int = 3,
+        guests: int = 50,
+        latency: Mapping[str, float] | None = None,
+        failure_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout_delay: float = 1.0,
+        agent_rate: float = 0.75,
+        seed: int = 0,
+    ):
+        super().__init__()
+        self.latency = dict(latency or {})
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = timeout_delay
+        self.requests: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._guests: dict[str, dict[str, list[dict[str, Any]]]] = {}
+        self._configs: dict[int, dict[str, Any]] = {}
+        self._agents: set[int] = set()
+        self._populate(nodes, guests, agent_rate)
+
+    def _populate(self, nodes: int, guests: int, agent_rate: float) -> None:
+        rnd = self._random
+        vmid = 100
+        for index in range(nodes):
+            node = f"pve{index}"
+            listing: dict[str, list[dict[str, Any]]] = {"qemu": [], "lxc": []}
+            for _ in range(guests):
+                vmid += 1
+                kind = "qemu" if rnd.random() < 0.6 else "lxc"
+                running = rnd.random() < 0.9
+                guest = {
+                    "vmid": vmid,
+                    "name": f"guest-{vmid}",
+                    "status": "running" if running else "stopped",
+                    "cpus": rnd.choice([1, 2, 4, 8]),
+                    "maxdisk": 32 << 30,
+                    "maxmem": 4 << 30,
+                    "maxswap": 0,
+                    "lock": "",
+                    "tags": rnd.choice(["", "prod", "prod;web", "db"]),
+                    "uptime": rnd.randint(60, 10**7) if running else 0,
+                }
+                address = f"10.{index}.{vmid >> 8 & 255}.{vmid & 255}"
+                config: dict[str, Any] = {
+                    "name": guest["name"],
+                    "cores": guest["cpus"],
+                    "sockets": 1,
+                    "memory": 4096,
+                    "description": f"simulated guest {vmid}",
+                }
+                if kind == "qemu":
+                    guest["pid"] = 10000 + vmid if running else None
+                    config["net0"] = (
+                        f"virtio=BC:24:11:00:{vmid & 255:02X}:01,bridge=vmbr0"
+                    )
+                    config["ipconfig0"] = f"ip={address}/16,gw=10.{index}.0.1"
+                    if running and rnd.random() < agent_rate:
+                        self._agents.add(vmid)
+                else:
+                    config["net0"] = (
+                        f"name=eth0,bridge=vmbr0,ip={address}/16,"
+                        f"ip6=fd00:{index}::{vmid:x}/64,type=veth"
+                    )
+                listing[kind].append(guest)
+                self._configs[vmid] = config
+            self._guests[node] = listing
+
+    @property
+    def guest_count(self) -> int:
+        return len(self._configs)
+
+    def attach(self, client: ProxmoxClient) -> None:
+        """Route all requests of the client to this simulation."""
+        client.client._store["session"].mount("https://", self)
+
+    def _kind(self, path: list[str]) -> str:
+        if path[0] != "nodes":
+            return path[0]
+        if len(path) <= 1:
+            return "nodes"
+        if len(path) <= 3:
+            return "guests"
+        return "agent" if "agent" in path else "config"
+
+    def _resolve(self, path: list[str]) -> Any:
+        match path:
+            case ["nodes"]:
+                return [
+                    {
+                        "node": node,
+                        "status": "online",
+                        "cpu": 0.1,
+                        "level": "",
+                        "maxcpu": 64,
+                        "maxmem": 256 << 30,
+                        "mem": 64 << 30,
+                        "ssl_fingerprint": "",
+                        "uptime": 10**6,
+                    }
+                    for node in self._guests
+                ]
+            case ["nodes", node, ("qemu" | "lxc") as kind]:
+                return self._guests[node][kind]
+            case ["nodes", _, ("qemu" | "lxc"), vmid, "config"]:
+                return self._configs[int(vmid)]
+            case ["nodes", _, "qemu", vmid, "agent", "info"]:
+                if int(vmid) not in self._agents:
+                    raise KeyError("QEMU guest agent is not running")
+                return {"result": {"version": "8.1.5"}}
+            case ["nodes", _, "qemu", vmid, "agent", "network-get-interfaces"]:
+                address = self._configs[int(vmid)]["ipconfig0"][3:].partition("/")[0]
+                return {
+                    "result": [
+                        _interface("lo", "127.0.0.1"),
+                        _interface("eth0", address),
+                    ]
+                }
+            case ["cluster", "resources"]:
+                return [
+                    _resource(node, kind, guest)
+                    for node, listing in self._guests.items()
+                    for kind, guests in listing.items()
+                    for guest in guests
+                ]
+            case ["cluster", "tasks"]:
+                return []
+            case ["pools", poolid]:
+                return {"poolid": poolid, "members": []}
+        raise KeyError(f"no such path {'/'.join(path)}")
+
+    def send(
+        self,
+        request: requests.PreparedRequest,
+        stream: bool = False,
+        timeout: Any = None,
+        verify: Any = True,
+        cert: Any = None,
+        proxies: Any = None,
+    ) -> requests.Response:
+        url = urlsplit(request.url or "")
+        path = url.path.removeprefix(API_ROOT).strip("/").split("/")
+        kind = self._kind(path)
+        with self._lock:
+            self.requests[kind] += 1
+            roll = self._random.random()
+        delay = self.latency.get(kind, self.latency.get("*", 0.0))
+        if roll < self.timeout_rate:
+            time.sleep(self.timeout_delay)
+            raise requests.ReadTimeout(f"simulated timeout of {url.path}")
+        if delay:
+            time.sleep(delay)
+        if roll < self.timeout_rate + self.failure_rate:
+            return _response(request, 503, {"data": None}, "Service Unavailable")
+        try:
+            data = self._resolve(path)
+        except KeyError as e:
+            return _response(request, 500, {"data": None, "errors": str(e)}, str(e))
+        return _response(request, 200, {"data": data}, "OK")
+
+    def close(self) -> None:
+        pass
+
+
+def _resource(node: str, kind: str, guest: dict[str, Any]) -> dict[str, Any]:
+    """A guest as /cluster/resources reports it.
+
+    Unlike the per-node listings it carries no pid, and lock and tags only
+    when they are set.
+    """
+    resource = {
+        "id": f"{kind}/{guest['vmid']}",
+        "type": kind,
+        "node": node,
+        "vmid": guest["vmid"],
+        "name": guest["name"],
+        "status": guest["status"],
+        "maxcpu": guest["cpus"],
+        "maxdisk": guest["maxdisk"],
+        "maxmem": guest["maxmem"],
+        "uptime": guest["uptime"],
+        "template": 0,
+    }
+    for key in ("lock", "tags"):
+        if guest[key]:
+            resource[key] = guest[key]
+    return resource
+
+
+def _interface(name: str, address: str) -> dict[str, Any]:
+    return {
+        "name": name,
+        "hardware-address": "00:00:00:00:00:00",
+        "ip-addresses": [
+            {"ip-address": address, "ip-address-type": "ipv4", "prefix": 16}
+        ],
+        "statistics": {
+            key: 0
+            for key in (
+                "rx-bytes",
+                "rx-dropped",
+                "rx-errs",
+                "rx-packets",
+                "tx-bytes",
+                "tx-dropped",
+                "tx-errs",
+                "tx-packets",
+            )
+        },
+    }
+
+
+def _response(
+    request: requests.PreparedRequest, status: int, body: Any, reason: str
+) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response._content = json.dumps(body).encode()
+    response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+    response.encoding = "utf-8"
+    response.url = request.url or ""
+    response.request = request
+    return response
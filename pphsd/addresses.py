@@ -0,0 +1,133 @@
+import ipaddress
+import re
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, Mapping, NamedTuple
+
+from pphsd.config import Config
+from pphsd.exceptions import ConfigError
+from pphsd.pve_model import NetworkInterfaceConfig
+
+IPAddress = ipaddress.IPv4Address | ipaddress.IPv6Address
+IPNetwork = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+# net0..N hold the NICs of both guest types, containers put their addresses
+# there, vms configured by cloud-init have them in the matching ipconfigN
+_NIC_KEY = re.compile(r"(?:net|ipconfig)(\d+)")
+# the options of a PVE property string like "name=eth0,ip=10.0.0.2/24,..."
+# that matter for addresses, values without the prefix length
+_NIC_OPTION = re.compile(r"(?:^|,)(name|ip6?)=([^,/]*)")
+
+
+class Address(NamedTuple):
+    interface: str
+    # only parsed when it is a candidate for selection
+    address: str
+
+
+def parse_options(value: str) -> dict[str, str]:
+    """The name, ip and ip6 options of a NIC property string."""
+    return dict(_NIC_OPTION.findall(value))
+
+
+def parse_address(value: str) -> IPAddress | None:
+    """Parse an address, None for values like dhcp or auto."""
+    try:
+        # cheaper than ip_address, which tries IPv4 first and fails for IPv6
+        if ":" in value:
+            return ipaddress.IPv6Address(value)
+        return ipaddress.IPv4Address(value)
+    except ValueError:
+        return None
+
+
+def config_addresses(config: Mapping[str, Any]) -> Iterator[Address]:
+    """Static addresses of all NICs, in NIC order.
+
+    Containers are named by their name option, vms by their netN key. NICs
+    are only parsed as far as the addresses are consumed.
+    """
+    nics: dict[int, list[str]] = {}
+    for key, value in config.items():
+        if not key.startswith(("net", "ipconfig")) or not isinstance(value, str):
+            continue
+        match = _NIC_KEY.fullmatch(key)
+        if match is not None:
+            nics.setdefault(int(match.group(1)), []).append(value)
+    for index in sorted(nics):
+        options: dict[str, str] = {}
+        for value in nics[index]:
+            options.update(parse_options(value))
+        interface = options.get("name") or f"net{index}"
+        for key in ("ip", "ip6"):
+            if key in options:
+                yield Address(interface, options[key])
+
+
+def agent_addresses(networks: Iterable[NetworkInterfaceConfig]) -> Iterator[Address]:
+    """Addresses the guest agent reported, in interface order."""
+    for network in networks:
+        for ip_address in network.ip_addresses:
+            yield Address(network.name, ip_address.ip_address)
+
+
+@dataclass(frozen=True)
+class AddressSelector:
+    """Picks the IPv4 and IPv6 address of a guest.
+
+    Loopback and link-local addresses are never picked. With networks set,
+    only addresses inside one of them are, and addresses of the preferred
+    interfaces win over the rest, in order.
+    """
+
+    networks: tuple[IPNetwork, ...] = ()
+    interfaces: tuple[str, ...] = ()
+
+    @classmethod
+    def from_config(cls, config: Config) -> "AddressSelector":
+        try:
+            networks = tuple(
+                ipaddress.ip_network(network, strict=False)
+                for network in config.address_networks
+            )
+        except ValueError as e:
+            raise ConfigError("invalid address_networks", e) from e
+        return cls(networks, tuple(config.preferred_interfaces))
+
+    def _allowed(self, address: IPAddress) -> bool:
+        if address.is_loopback or address.is_link_local:
+            return False
+        if not self.networks:
+            return True
+        return any(
+            network.version == address.version and address in network
+            for network in self.networks
+        )
+
+    def _rank(self, address: Address) -> int:
+        try:
+            return self.interfaces.index(address.interface)
+        except ValueError:
+            return len(self.interfaces)
+
+    def select(self, addresses: Iterable[Address]) -> tuple[str, str]:
+        ipv4_address = ipv6_address = ""
+        if self.interfaces:
+            # sorted is stable, addresses of other interfaces keep their order
+            addresses = sorted(addresses, key=self._rank)
+        for candidate in addresses:
+            # only parse addresses of a family that is still missing
+            if ":" in candidate.address:
+                if ipv6_address:
+                    continue
+            elif ipv4_address:
+                continue
+            address = parse_address(candidate.address)
+            if address is None or not self._allowed(address):
+                continue
+            if address.version == 6:
+                ipv6_address = candidate.address
+            else:
+                ipv4_address = candidate.address
+            if ipv4_address and ipv6_address:
+                break
+        return ipv4_address, ipv6_address
@@ -1,44 +1,44 @@
-import json
-import shutil
-import tempfile
 import time
 import tomllib
-from os import chmod
+from threading import Thread
 
 import rich_click as click
-from flask import Flask, jsonify, Response
 from loguru import logger
-from pydantic.json import pydantic_encoder
+from prometheus_client import start_http_server
 
 from pphsd.config import Config
-from pphsd.discovery import Discovery
+from pphsd.scheduler import Scheduler
+from pphsd.snapshot import content_hash
+from pphsd.store import write_atomic
 
 
-def serve_http(config: Config, discovery: Discovery):
-    app = Flask(__name__)
+def serve_http(config: Config, scheduler: Scheduler):
+    # flask is only needed, and only imported, in http mode
+    from pphsd.server import create_app, serve
 
-    @app.route("/targets")
-    def targets():
-        hosts = discovery.discovery()
-        return jsonify([host.to_sd_json() for host in hosts.hosts])
+    thread = Thread(target=scheduler.run, args=(), daemon=True)
+    thread.start()
+    serve(config, create_app(config, scheduler))
 
-    app.run(host=config.http_address, port=config.http_port)
 
+def _read_hash(path: str) -> str | None:
+    try:
+        with open(path, "rb") as f:
+            return content_hash(f.read())
+    except OSError:
+        return None
 
-def serve_file(config: Config, discovery: Discovery):
-    while True:
-        hosts = discovery.discovery()
-        temp_file = tempfile.NamedTemporaryFile(
-            mode="w", prefix="prometheus-pve-sd", delete=False
-        )
-        with temp_file as tf:
-            json.dump([host.to_sd_json() for host in hosts.hosts], tf, indent=4)
 
-        shutil.move(temp_file.name, config.output_file)
-        chmod(
-            config.output_file,
-            int(config.output_file_mode, 8),
-        )
+def serve_file(config: Config, scheduler: Scheduler):
+    written = _read_hash(config.output_file)
+    while True:
+        snapshot = scheduler.refresh()
+        if snapshot is not None and snapshot.etag != written:
+            write_atomic(
+                config.output_file, snapshot.payload, int(config.output_file_mode, 8)
+            )
+            written = snapshot.etag
+            logger.info(f"wrote {len(snapshot.hosts)} hosts to {config.output_file}")
         time.sleep(config.interval)
 
 
@@ -65,13 +65,19 @@ def main(config, output, file_mode, mode, delay):
     if mode != "":
         logger.info(f"serve mode: {mode}")
         config_data.serve_mode = mode
-    discovery = Discovery(config_data)
-    # thread = Thread(target=discovery.run, args=(), daemon=True)
-    # thread.start()
+    if config_data.metrics_config.enabled:
+        logger.info(
+            f"serving metrics on {config_data.metrics_config.address}:"
+            f"{config_data.metrics_config.port}"
+        )
+        start_http_server(
+            config_data.metrics_config.port, config_data.metrics_config.address
+        )
+    scheduler = Scheduler(config_data)
     if mode == "http":
-        serve_http(config_data, discovery)
+        serve_http(config_data, scheduler)
     elif mode == "file":
-        serve_file(config_data, discovery)
+        serve_file(config_data, scheduler)
 
 
 if __name__ == "__main__":
@@ -1,46 +1,192 @@
-from typing import Any, cast
+import random
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Callable, Iterator, cast
 
 import requests
 from loguru import logger
-from proxmoxer import ProxmoxAPI
+from proxmoxer import AuthenticationError, ProxmoxAPI, ResourceException
+from pydantic import ValidationError
+from requests.adapters import HTTPAdapter
 
-from pphsd.config import Config
+from pphsd.config import Config, PVEConfig
 from pphsd.exceptions import APIError
-from pphsd.metrics import PVE_REQUEST_COUNT_ERROR_TOTAL, PVE_REQUEST_COUNT_TOTAL
-from pphsd.pve_model import LXCDetail, NetworkInterfaceConfig, NodeDetail, VMDetail
+from pphsd.metrics import (
+    PVE_REQUEST_CACHE_HITS_TOTAL,
+    PVE_REQUEST_CACHE_MISSES_TOTAL,
+    PVE_REQUEST_COUNT_ERROR_TOTAL,
+    PVE_REQUEST_COUNT_TOTAL,
+    PVE_REQUEST_SECONDS,
+    PVE_REQUESTS_IN_FLIGHT,
+)
+from pphsd.pve_model import (
+    LXCDetail,
+    NetworkInterfaceConfig,
+    NodeDetail,
+    TaskDetail,
+    VMDetail,
+)
+
+# guest types as used in labels mapped to their segment in the API path
+API_TYPES = {"qemu": "qemu", "container": "lxc"}
+# bad gateway and unavailable responses, plus the codes PVE uses when the
+# node it proxies a request to cannot be reached
+TRANSIENT_STATUS_CODES = {502, 503, 504, 595, 596}
+
+
+def _endpoint(args: tuple[str, ...]) -> str:
+    """API path with node names and vmids replaced, used as a metric label."""
+    parts = list(args)
+    if parts[:1] == ["nodes"]:
+        if len(parts) > 1:
+            parts[1] = "{node}"
+        if len(parts) > 3:
+            parts[3] = "{vmid}"
+    return "/".join(parts)
+
+
+def _per_guest(args: tuple[str, ...]) -> bool:
+    # nodes/{node}/{type}/{vmid}/...
+    return args[:1] == ("nodes",) and len(args) > 3
 
 
 class ProxmoxClient:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, pve_config: PVEConfig | None = None):
         self.config = config
-        self.client = self._auth()
+        self.pve_config = pve_config or config.pve_config
+        self._auth_lock = Lock()
+        # authenticated on first use, so startup never waits for PVE
+        self._client: ProxmoxAPI | None = None
+        self._cycle_cache: dict[tuple[Any, ...], Any] | None = None
+        # called with path, seconds, response and error of every request
+        self.tracer: Callable[[str, float, Any, Exception | None], None] | None = None
+
+    @property
+    def client(self) -> ProxmoxAPI:
+        client = self._client
+        if client is None:
+            with self._auth_lock:
+                if self._client is None:
+                    self._client = self._auth()
+                client = self._client
+        return client
 
-    def _auth(self):
+    def _auth(self) -> ProxmoxAPI:
+        pve_config = self.pve_config
+        # API tokens are sent with every request and skip the ticket handshake
+        credentials = (
+            {"token_name": pve_config.token_name, "token_value": pve_config.token_value}
+            if pve_config.token_name
+            else {"password": pve_config.password}
+        )
         try:
             logger.debug(
                 "Trying to authenticate against {} as user {}".format(
-                    self.config.pve_config.server, self.config.pve_config.user
+                    pve_config.server, pve_config.user
                 )
             )
-            return ProxmoxAPI(
-                self.config.pve_config.server,
-                user=self.config.pve_config.user,
-                password=self.config.pve_config.password,
-                verify_ssl=self.config.pve_config.verify_ssl,
-                timeout=self.config.pve_config.auth_timeout,
+            client = ProxmoxAPI(
+                pve_config.server,
+                user=pve_config.user,
+                verify_ssl=pve_config.verify_ssl,
+                timeout=pve_config.auth_timeout,
+                **credentials,
             )
-        except requests.RequestException as e:
+        except (requests.RequestException, AuthenticationError) as e:
             PVE_REQUEST_COUNT_ERROR_TOTAL.inc()
             raise APIError(str(e)) from e
+        # keep one pooled connection per discovery worker instead of the
+        # default of 10, so concurrent fetches don't reconnect
+        adapter = HTTPAdapter(pool_maxsize=max(self.config.max_workers, 1))
+        client._store["session"].mount("https://", adapter)
+        return client
 
-    def _do_request(self, *args) -> Any:
+    def _renew(self, failed: ProxmoxAPI) -> None:
+        with self._auth_lock:
+            # another thread may have renewed already
+            if self._client is failed:
+                logger.info("PVE rejected the ticket, authenticating again")
+                self._client = self._auth()
+
+    def _backoff(self, attempt: int) -> float:
+        pve_config = self.pve_config
+        delay = min(pve_config.retry_backoff * 2**attempt, pve_config.retry_backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _request(self, *args: Any, **params: Any) -> Any:
+        retries = self.pve_config.retries
+        renewed = False
+        attempt = 0
+        while True:
+            client = self.client
+            try:
+                return client.get(*args, **params)
+            except ResourceException as e:
+                if e.status_code == 401 and not renewed:
+                    renewed = True
+                    self._renew(client)
+                    continue
+                if e.status_code not in TRANSIENT_STATUS_CODES or attempt >= retries:
+                    raise
+                error: Exception = e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= retries:
+                    raise
+                error = e
+            delay = self._backoff(attempt)
+            attempt += 1
+            logger.debug(
+                f"retrying {'/'.join(map(str, args))} in {delay:.2f}s "
+                f"({attempt}/{retries}): {error}"
+            )
+            time.sleep(delay)
+
+    @contextmanager
+    def cycle(self) -> Iterator[None]:
+        """Serve repeated reads of the same API path from memory until exit.
+
+        Guest configs and agent replies are read once per cycle, they are
+        never cached, only node, pool and cluster wide reads are.
+        """
+        self._cycle_cache = {}
+        try:
+            yield
+        finally:
+            self._cycle_cache = None
+
+    def _get(self, *args: Any, **params: Any) -> Any:
+        path = tuple(str(arg) for arg in args)
+        cache = None if _per_guest(path) else self._cycle_cache
+        key = path + tuple(sorted(params.items()))
+        if cache is not None:
+            if key in cache:
+                PVE_REQUEST_CACHE_HITS_TOTAL.inc()
+                return cache[key]
+            PVE_REQUEST_CACHE_MISSES_TOTAL.inc()
         PVE_REQUEST_COUNT_TOTAL.inc()
+        tracer = self.tracer
+        start = time.perf_counter()
         try:
-            # create a new tuple containing nodes and unpack it again for client.get
-            return self.client.get(*("nodes", *args))
-        except requests.RequestException as e:
+            with (
+                PVE_REQUESTS_IN_FLIGHT.track_inprogress(),
+                PVE_REQUEST_SECONDS.labels(_endpoint(path)).time(),
+            ):
+                response = self._request(*args, **params)
+        except (requests.RequestException, ResourceException) as e:
             PVE_REQUEST_COUNT_ERROR_TOTAL.inc()
+            if tracer is not None:
+                tracer("/".join(path), time.perf_counter() - start, None, e)
             raise APIError(str(e)) from e
+        if tracer is not None:
+            tracer("/".join(path), time.perf_counter() - start, response, None)
+        if cache is not None:
+            cache[key] = response
+        return response
+
+    def _do_request(self, *args) -> Any:
+        # create a new tuple containing nodes and unpack it again for client.get
+        return self._get(*("nodes", *args))
 
     def get_nodes(self) -> list[NodeDetail]:
         logger.debug("fetching all nodes")
@@ -57,15 +203,73 @@ class ProxmoxClient:
         response = cast(list[dict[str, Any]], self._do_request(pve_node, "lxc"))
         return [LXCDetail.model_validate(container) for container in response]
 
+    def get_cluster_guests(
+        self,
+    ) -> tuple[list[VMDetail | LXCDetail], dict[str, str]]:
+        """The guests of all nodes, and why the guests of some did not validate.
+
+        PVE still lists the guests of an offline node, with status unknown,
+        such nodes are returned as failed instead of losing their guests.
+        """
+        logger.debug("fetching all guests from cluster resources")
+        response = cast(
+            list[dict[str, Any]], self._get("cluster", "resources", type="vm")
+        )
+        guests: list[VMDetail | LXCDetail] = []
+        failed: dict[str, str] = {}
+        for resource in response:
+            # cluster resources report maxcpu and omit fields the per-node
+            # listings always carry
+            resource = {
+                "cpus": resource.get("maxcpu"),
+                "lock": "",
+                "maxswap": None,
+                "tags": "",
+                **resource,
+            }
+            try:
+                match resource.get("type"):
+                    case "qemu":
+                        guests.append(VMDetail.model_validate(resource))
+                    case "lxc":
+                        guests.append(LXCDetail.model_validate(resource))
+            except ValidationError as e:
+                node = resource.get("node")
+                if not node:
+                    logger.warning(
+                        f"skipping cluster resource {resource.get('id')}: {e}"
+                    )
+                    continue
+                failed.setdefault(
+                    node,
+                    f"invalid cluster resource {resource.get('id')}: "
+                    f"{e.errors()[0]['msg']}",
+                )
+        return guests, failed
+
+    def get_cluster_tasks(self) -> list[TaskDetail]:
+        logger.debug("fetching cluster tasks")
+        response = cast(list[dict[str, Any]], self._get("cluster", "tasks"))
+        return [TaskDetail.model_validate(task) for task in response]
+
+    def get_pool_members(self, poolid: str) -> list[int]:
+        logger.debug(f"fetching members of pool {poolid}")
+        response = cast(dict[str, Any], self._get("pools", poolid))
+        return [
+            member["vmid"] for member in response.get("members", []) if "vmid" in member
+        ]
+
     def get_instance_config(
         self, pve_node: str, pve_type: str, vmid: int
     ) -> dict[str, Any]:
         logger.debug(f"fetching instance config for {vmid} on {pve_node}")
-        return self._do_request(pve_node, pve_type, vmid, "config")
+        return self._do_request(pve_node, API_TYPES[pve_type], vmid, "config")
 
     def get_agent_info(self, pve_node: str, pve_type: str, vmid: int) -> Any:
         logger.debug(f"fetching agent info for {vmid} on {pve_node}")
-        return self._do_request(pve_node, pve_type, vmid, "agent", "info")["result"]
+        return self._do_request(pve_node, API_TYPES[pve_type], vmid, "agent", "info")[
+            "result"
+        ]
 
     def get_network_interfaces(
         self, pve_node: str, vmid: int
@@ -23,11 +23,20 @@ class PVEConfig(BaseSettings):
     model_config = SettingsConfigDict(
         env_prefix="prometheus_pve_http_sd_pve_", extra="allow"
     )
+    # added as __meta_pve_cluster, required when several clusters are configured
+    name: str = Field("", env="name")
     server: str = Field("", env="server")
     user: str = Field("", env="user")
     password: str = Field("", env="password")
+    # API token auth is used instead of the password when token_name is set
+    token_name: str = Field("", env="token_name")
+    token_value: str = Field("", env="token_value")
     auth_timeout: int = Field(5, env="auth_timeout")
     verify_ssl: bool = Field(True, env="verify_ssl")
+    # transient errors are retried with jittered exponential backoff
+    retries: int = Field(3, env="retries")
+    retry_backoff: float = Field(0.5, env="retry_backoff")
+    retry_backoff_max: float = Field(10.0, env="retry_backoff_max")
 
 
 class Config(BaseSettings):
@@ -40,13 +49,68 @@ class Config(BaseSettings):
     serve_mode: str = Field("http", env="serve_mode")
     service: bool = Field(True, env="service")
     interval: int = Field(10, env="interval")
+    # the last published hosts are saved here and served right after a
+    # restart until the first refresh completes, empty disables it
+    cache_file: str = Field("", env="cache_file")
+    # seconds after which a snapshot is no longer served, 0 serves it forever
+    max_staleness: int = Field(0, env="max_staleness")
+    # "nodes" lists guests per node, "cluster" uses a single /cluster/resources call
+    inventory_mode: str = Field("nodes", env="inventory_mode")
+    # only re-fetch details of guests whose listing changed, with a full
+    # re-fetch every full_resync_interval seconds
+    incremental: bool = Field(False, env="incremental")
+    full_resync_interval: int = Field(600, env="full_resync_interval")
+    # guest agent results are cached per guest until the guest restarts or the
+    # ttl expires, guests without a reachable agent are retried with backoff
+    agent_cache_size: int = Field(10000, env="agent_cache_size")
+    agent_cache_ttl: int = Field(300, env="agent_cache_ttl")
+    agent_negative_ttl: int = Field(60, env="agent_negative_ttl")
+    agent_negative_max_ttl: int = Field(3600, env="agent_negative_max_ttl")
+    # poll /cluster/tasks every event_interval seconds and refresh the guests
+    # touched by finished tasks right away, interval then only sets the full
+    # reconciliation, 0 disables it
+    event_interval: int = Field(0, env="event_interval")
+    # seconds a node's requests may run per cycle, time queued behind other
+    # nodes not counted, before its last known guests are served instead,
+    # marked with __meta_pve_stale, 0 disables the deadline
+    node_timeout: int = Field(60, env="node_timeout")
+    # global and per-node limits for concurrent PVE requests, shared by all
+    # clusters
+    max_workers: int = Field(8, env="max_workers")
+    max_requests_per_node: int = Field(4, env="max_requests_per_node")
     http_address: str = Field("0.0.0.0", env="http_address")
     http_port: int = Field(8080, env="http_port")
+    # "waitress" for the production server, "flask" for the development server
+    http_server: str = Field("waitress", env="http_server")
+    http_threads: int = Field(8, env="http_threads")
+    http_connection_limit: int = Field(100, env="http_connection_limit")
+    # seconds an idle keep-alive connection is held open
+    http_keepalive_timeout: int = Field(120, env="http_keepalive_timeout")
+    # serves /debug/profile, which profiles the next discovery cycles on
+    # request and returns the stack samples and request traces
+    admin_enabled: bool = Field(False, env="admin_enabled")
+    admin_max_cycles: int = Field(10, env="admin_max_cycles")
     exclude_state: list[str] = Field([], env="exclude_state")
     exclude_vmid: list[int] = Field([], env="exclude_vmid")
     include_vmid: list[int] = Field([], env="include_vmid")
     exclude_tags: list[str] = Field([], env="exclude_tags")
     include_tags: list[str] = Field([], env="include_tags")
+    # excluded nodes are not listed at all
+    include_nodes: list[str] = Field([], env="include_nodes")
+    exclude_nodes: list[str] = Field([], env="exclude_nodes")
+    # in the "nodes" inventory mode pool rules cost one request per pool
+    include_pools: list[str] = Field([], env="include_pools")
+    exclude_pools: list[str] = Field([], env="exclude_pools")
+    # only addresses inside these networks are used, empty allows all
+    address_networks: list[str] = Field([], env="address_networks")
+    # addresses of these interfaces are preferred, in order; agent names like
+    # "eth0", container NIC names or "netN" for the NICs in the vm config
+    preferred_interfaces: list[str] = Field([], env="preferred_interfaces")
     metrics_config: MetricsConfig = Field(default_factory=lambda: MetricsConfig())
     logging_config: LoggingConfig = Field(default_factory=lambda: LoggingConfig())
     pve_config: PVEConfig = Field(default_factory=lambda: PVEConfig())
+    clusters: list[PVEConfig] = Field([], env="clusters")
+
+    def pve_configs(self) -> list[PVEConfig]:
+        """The configured clusters, falling back to the single pve_config."""
+        return self.clusters or [self.pve_config]
@@ -1,28 +1,45 @@
-import ipaddress
-import re
 import time
-from threading import Thread
-from typing import cast, Literal
+from itertools import chain
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import replace
+from threading import Lock
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Iterator,
+    Literal,
+    Mapping,
+    NamedTuple,
+    TypeVar,
+    cast,
+)
 
 from loguru import logger
 
+from pphsd.addresses import AddressSelector, agent_addresses, config_addresses
+from pphsd.cache import TTLCache
 from pphsd.client import ProxmoxClient
-from pphsd.config import Config
+from pphsd.config import Config, PVEConfig
+from pphsd.events import TaskWatcher
 from pphsd.exceptions import APIError
+from pphsd.filters import GuestFilter
+from pphsd.fetcher import FetchEngine
+from pphsd.metrics import (
+    AGENT_CACHE_HITS_TOTAL,
+    AGENT_CACHE_MISSES_TOTAL,
+    DISCOVERY_ERRORS_TOTAL,
+    DISCOVERY_PHASE_SECONDS,
+    NODE_ERRORS_TOTAL,
+    PROPAGATION_TIME,
+    TASK_EVENTS_TOTAL,
+)
 from pphsd.model import Host, Hosts
-from pphsd.pve_model import NodeDetail, VMDetail, LXCDetail
+from pphsd.profiling import ProfileSession
+from pphsd.pve_model import LXCDetail, NetworkInterfaceConfig, NodeDetail, VMDetail
+from pphsd.snapshot import Snapshot
 
-
-def _validate_ip(address: str) -> Literal[False] | str:
-    try:
-        if (
-            not ipaddress.ip_address(address).is_loopback
-            and not ipaddress.ip_address(address).is_link_local
-        ):
-            return address
-    except ValueError:
-        return False
-    return False
+T = TypeVar("T")
 
 
 def _get_names(
@@ -37,149 +54,551 @@ def _get_names(
     return names
 
 
+def _pve_type(
+    vm: VMDetail | LXCDetail,
+) -> Literal["qemu"] | Literal["container"]:
+    return "qemu" if isinstance(vm, VMDetail) else "container"
+
+
+def _fingerprint(node: str, vm: VMDetail | LXCDetail) -> tuple[object, ...]:
+    """Listing fields whose change means a guest's details must be re-fetched."""
+    pid = vm.pid if isinstance(vm, VMDetail) else None
+    return node, vm.status, vm.name, vm.tags, vm.lock, pid
+
+
+class _GuestState(NamedTuple):
+    fingerprint: tuple[object, ...]
+    uptime: int
+    host: Host
+
+
+class _NodeClock:
+    """Seconds any of a node's calls has been running in this cycle.
+
+    Time its calls spend queued for a worker of the shared engine does not
+    count, so a node is never failed for waiting behind other nodes.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._running = 0
+        self._since = 0.0
+        self._elapsed = 0.0
+
+    def track(self, fn: Callable[..., T]) -> Callable[..., T]:
+        def tracked(*args: Any) -> T:
+            with self._lock:
+                if not self._running:
+                    self._since = time.monotonic()
+                self._running += 1
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    if not self._running:
+                        self._elapsed += time.monotonic() - self._since
+
+        return tracked
+
+    @property
+    def elapsed(self) -> float:
+        with self._lock:
+            if self._running:
+                return self._elapsed + time.monotonic() - self._since
+            return self._elapsed
+
+
+class _AgentResult(NamedTuple):
+    pid: int | None
+    status: str
+    # uptime when last seen, a lower one means the guest was restarted
+    uptime: int
+    # None when the guest had no reachable agent
+    networks: list[NetworkInterfaceConfig] | None
+    failures: int
+
+    def same_run(self, vm: VMDetail) -> bool:
+        """Whether vm still runs the instance this result was seen for.
+
+        /cluster/resources carries no pid, status and uptime also catch
+        restarts there.
+        """
+        return (
+            self.pid == vm.pid
+            and self.status == vm.status.value
+            and (vm.uptime or 0) >= self.uptime
+        )
+
+
 class Discovery:
-    def __init__(self, config: Config):
+    def __init__(
+        self,
+        config: Config,
+        engine: FetchEngine | None = None,
+        pve_config: PVEConfig | None = None,
+    ):
         self.config = config
-        self.client = ProxmoxClient(config)
+        self.client = ProxmoxClient(config, pve_config)
+        self.cluster = self.client.pve_config.name
+        self.engine = engine or FetchEngine(
+            config.max_workers, config.max_requests_per_node
+        )
         self.hosts = Hosts([])
+        self.snapshot: Snapshot | None = None
+        # last known state per (pve_type, vmid), used by incremental discovery
+        self._guests: dict[tuple[str, int], _GuestState] = {}
+        # when each node's guests were last all re-fetched, per node so a
+        # failing node does not hold back the resync of the others
+        self._synced: dict[str, float] = {}
+        # hosts of the last successful refresh of each node
+        self._nodes: dict[str, list[Host]] = {}
+        self._agent_cache: TTLCache[tuple[str, int], _AgentResult] = TTLCache(
+            config.agent_cache_size
+        )
+        self._tasks = TaskWatcher()
+        # vmids touched by tasks, until a refresh that covered their node
+        # succeeded, the task cursor has already moved past them
+        self._pending: set[int] = set()
+        self.filter = GuestFilter.from_config(config)
+        self.addresses = AddressSelector.from_config(config)
+        self._profile: ProfileSession | None = None
+        # clocks of the current cycle, tasks keep the clock they were submitted with
+        self._clocks: dict[str, _NodeClock] = {}
+
+    def _get_agent_networks(
+        self, pve_node: str, vm: VMDetail
+    ) -> list[NetworkInterfaceConfig] | None:
+        vmid = vm.vmid
+        key = (pve_node, vmid)
+        cached = self._agent_cache.get(key)
+        # after a restart the agent state is unknown
+        if cached is not None and cached.same_run(vm):
+            AGENT_CACHE_HITS_TOTAL.inc()
+            # check the next cycle's uptime against this one
+            self._agent_cache.replace(key, cached._replace(uptime=vm.uptime or 0))
+            return cached.networks
+        AGENT_CACHE_MISSES_TOTAL.inc()
+        networks = None
+        try:
+            with DISCOVERY_PHASE_SECONDS.labels("agent").time():
+                if self.client.get_agent_info(pve_node, "qemu", vmid) is not None:
+                    networks = self.client.get_network_interfaces(pve_node, vmid)
+        except Exception as e:  # noqa
+            logger.debug(f"guest agent of {vmid} on {pve_node} not available: {e}")
+        result = _AgentResult(vm.pid, vm.status.value, vm.uptime or 0, networks, 0)
+        if networks is not None:
+            self._agent_cache.set(key, result, self.config.agent_cache_ttl)
+            return networks
+        previous = self._agent_cache.peek(key)
+        failures = previous.failures + 1 if previous and previous.same_run(vm) else 1
+        ttl = min(
+            self.config.agent_negative_ttl * 2 ** (failures - 1),
+            self.config.agent_negative_max_ttl,
+        )
+        self._agent_cache.set(key, result._replace(failures=failures), ttl)
+        return None
 
     def _get_ip_address(
-        self, pve_type: Literal["qemu"] | Literal["container"], pve_node: str, vmid: int
+        self, pve_node: str, vm: VMDetail | LXCDetail, config: Mapping[str, Any]
     ) -> tuple[str, str]:
-        ipv4_address: str = ""
-        ipv6_address: str = ""
-        if pve_type == "qemu":
-            networks = None
-            try:
-                if self.client.get_agent_info(pve_node, pve_type, vmid) is not None:
-                    networks = self.client.get_network_interfaces(pve_node, vmid)
-            except Exception:  # noqa
-                pass
-            if networks:
-                for network in networks:
-                    for ip_address in network.ip_addresses:
-                        if ip_address.ip_address_type == "ipv4" and not ipv4_address:
-                            ipv4_address = _validate_ip(ip_address.ip_address)
-                        elif ip_address.ip_address_type == "ipv6" and not ipv6_address:
-                            ipv6_address = _validate_ip(ip_address.ip_address)
-        config = self.client.get_instance_config(pve_node, pve_type, vmid)
-        if config and ipv4_address == "":
-            try:
-                if "ipconfig0" in config:
-                    sources = [config["net0"], config["ipconfig0"]]
-                else:
-                    sources = [config["net0"]]
-
-                for s in sources:
-                    find = re.search(r"ip=(\d*\.\d*\.\d*\.\d*)", str(s))
-                    if find and find.group(1):
-                        ipv4_address = find.group(1)
-                        break
-            except Exception:  # noqa
-                pass
-        if config and ipv6_address == "":
-            try:
-                if "ipconfig0" in config:
-                    sources = [config["net0"], config["ipconfig0"]]
-                else:
-                    sources = [config["net0"]]
-
-                for s in sources:
-                    find = re.search(
-                        r"ip=(([a-fA-F0-9]{0,4}:{0,2}){0,7}:[0-9a-fA-F]{1,4})", str(s)
-                    )
-                    if find and find.group(1):
-                        ipv6_address = find.group(1)
-                        break
-            except Exception:  # noqa
-                pass
+        networks = None
+        if isinstance(vm, VMDetail):
+            networks = self._get_agent_networks(pve_node, vm)
+        # static addresses only win over the agent's for preferred interfaces
+        return self.addresses.select(
+            chain(agent_addresses(networks or []), config_addresses(config or {}))
+        )
 
-        return cast(tuple[str, str], (ipv4_address, ipv6_address))
+    def _slot(self, node: str) -> str:
+        # node names are only unique within one cluster
+        return f"{self.cluster}/{node}" if self.cluster else node
 
-    def _filer(
-        self, pve_list: list[VMDetail] | list[LXCDetail]
-    ) -> list[VMDetail | LXCDetail]:
-        results = []
-        for item in pve_list:
-            if (
-                len(self.config.include_vmid)
-                and str(item.vmid) not in self.config.include_vmid
-            ):
-                continue
-            if len(self.config.include_tags) and (
-                bool(item.tags) is False
-                or (
-                    item.tags
-                    and set(item.tags.split(",")).isdisjoint(self.config.include_tags)
-                )
-            ):
-                continue
-            if isinstance(item, VMDetail) and item.template == 1:
-                continue
-            if item.status in self.config.exclude_state:
-                continue
-            if item.vmid in self.config.exclude_vmid:
-                continue
-            if len(self.config.exclude_tags) and (
-                bool(item.tags) is False
-                or not (
-                    item.tags
-                    and set(item.tags.split(",")).isdisjoint(self.config.include_tags)
+    def _submit(self, node: str, fn: Callable[..., T], *args: Any) -> Future[T]:
+        fn = self._clocks.setdefault(node, _NodeClock()).track(fn)
+        session = self._profile
+        if session is not None and session.active:
+            fn = session.wrap(fn)
+        return self.engine.submit(self._slot(node), fn, *args)
+
+    def _remaining(self, node: str) -> float | None:
+        """Seconds node's calls may still run, None without a deadline."""
+        clock = self._clocks.get(node)
+        if not self.config.node_timeout or clock is None:
+            return None
+        return self.config.node_timeout - clock.elapsed
+
+    def _wait(self, node: str, future: Future[T]) -> T:
+        """Result of future, failing once node's calls ran for node_timeout."""
+        while not future.done():
+            remaining = self._remaining(node)
+            if remaining is None:
+                break
+            if remaining <= 0:
+                raise TimeoutError(
+                    f"no result after running for {self.config.node_timeout}s"
                 )
-            ):
-                continue
-            results.append(item)
-        return results
+            # the clock stands still while the node's calls wait for a worker
+            wait([future], timeout=remaining)
+        return future.result()
+
+    def _wait_listings(
+        self, listings: list[tuple[str, Future[list[VMDetail | LXCDetail]]]]
+    ) -> Iterator[tuple[str, Future[list[VMDetail | LXCDetail]]]]:
+        """Yield listings as they finish or their node runs out of time."""
+        pending = dict(listings)
+        while pending:
+            deadlines = [
+                remaining
+                for node in pending
+                if (remaining := self._remaining(node)) is not None
+            ]
+            wait(
+                pending.values(),
+                timeout=max(0.0, min(deadlines)) if deadlines else None,
+                return_when=FIRST_COMPLETED,
+            )
+            for node, listing in list(pending.items()):
+                remaining = self._remaining(node)
+                if listing.done() or (remaining is not None and remaining <= 0):
+                    del pending[node]
+                    yield node, listing
+
+    def _pool_members(self) -> dict[int, str]:
+        members: dict[int, str] = {}
+        for pool in sorted(self.filter.pools):
+            for vmid in self.client.get_pool_members(pool):
+                members[vmid] = pool
+        return members
+
+    def _list_guests(
+        self, node: str, pools: Mapping[int, str]
+    ) -> list[VMDetail | LXCDetail]:
+        try:
+            with DISCOVERY_PHASE_SECONDS.labels("listing").time():
+                guests: list[VMDetail | LXCDetail] = [
+                    *self.client.get_all_vms(node),
+                    *self.client.get_all_containers(node),
+                ]
+        except Exception as e:
+            raise APIError(str(e)) from e
+        # per-node listings do not carry the pool
+        for guest in guests:
+            guest.pool = pools.get(guest.vmid)
+        return self.filter.apply(guests)
 
-    def discovery(self) -> Hosts:
-        self.hosts.clear()
+    def _list_cluster_guests(
+        self,
+    ) -> tuple[dict[str, list[VMDetail | LXCDetail]], dict[str, str]]:
+        """The guests by node, and why the nodes that failed did."""
+        try:
+            with DISCOVERY_PHASE_SECONDS.labels("listing").time():
+                guests, failed = self.client.get_cluster_guests()
+        except Exception as e:
+            raise APIError(str(e)) from e
+        failed = {
+            node: reason
+            for node, reason in failed.items()
+            if self.filter.node_allowed(node)
+        }
+        by_node: dict[str, list[VMDetail | LXCDetail]] = {}
+        # per node, vms come before containers like in the per-node listings
+        for guest in sorted(
+            self.filter.apply(guests), key=lambda item: isinstance(item, LXCDetail)
+        ):
+            node = cast(str, guest.node)
+            if self.filter.node_allowed(node) and node not in failed:
+                by_node.setdefault(node, []).append(guest)
+        return by_node, failed
+
+    def _listings(self) -> list[tuple[str, Future[list[VMDetail | LXCDetail]]]]:
+        if self.config.inventory_mode == "cluster":
+            by_node, failed = self._list_cluster_guests()
+            logger.info(f"found nodes: {[*by_node, *failed]}")
+            listings = []
+            for node, guests in by_node.items():
+                listing: Future[list[VMDetail | LXCDetail]] = Future()
+                listing.set_result(guests)
+                listings.append((node, listing))
+            for node, reason in failed.items():
+                # served from the node's last known guests like a failed listing
+                listing = Future()
+                listing.set_exception(APIError(reason))
+                listings.append((node, listing))
+            return listings
         nodes = _get_names(self.client.get_nodes(), "node")
         logger.info(f"found nodes: {nodes}")
-        for node in nodes:
+        pools = self._pool_members()
+        return [
+            (
+                node,
+                self._submit(node, self._list_guests, node, pools),
+            )
+            for node in nodes
+            if self.filter.node_allowed(node)
+        ]
+
+    def _build_host(self, node: str, vm: VMDetail | LXCDetail) -> Host:
+        vmid = vm.vmid
+        pve_type = _pve_type(vm)
+        with DISCOVERY_PHASE_SECONDS.labels("config").time():
+            config = self.client.get_instance_config(node, pve_type, vmid)
+        try:
+            description = config["description"]
+        except KeyError:
+            description = None
+        except Exception as e:  # noqa
+            raise APIError(str(e)) from e
+        ipv4_address, ipv6_address = self._get_ip_address(node, vm, config)
+        host = Host(
+            hostname=cast(str, vm.name),
+            ipv4_address=ipv4_address,
+            ipv6_address=ipv6_address,
+            vmid=vmid,
+            pve_type=pve_type,
+            labels={},
+            cluster=self.cluster,
+            node=node,
+            status=vm.status.value,
+        )
+        config_flags = [
+            ("cpu", "sockets"),
+            ("cores", "cores"),
+            ("memory", "memory"),
+        ]
+        for key, flag in config_flags:
+            if flag in config:
+                host.add_label(key, config[flag])
+        host.add_label("status", vm.status.value)
+        host.add_label("tags", vm.tags)
+        return host
+
+    def _unchanged_host(
+        self, node: str, vm: VMDetail | LXCDetail, changed: Collection[int]
+    ) -> Host | None:
+        if vm.vmid in changed:
+            return None
+        previous = self._guests.get((_pve_type(vm), vm.vmid))
+        if previous is None or previous.fingerprint != _fingerprint(node, vm):
+            return None
+        # a lower uptime than last cycle means the guest was restarted
+        if (vm.uptime or 0) < previous.uptime:
+            return None
+        return previous.host
+
+    def _full_sync(
+        self, node: str, changed: Collection[int] | None, now: float
+    ) -> bool:
+        """Whether all of node's guests are re-fetched this cycle."""
+        if changed is not None:
+            return False
+        if not self.config.incremental:
+            return True
+        synced = self._synced.get(node)
+        return synced is None or now - synced >= self.config.full_resync_interval
+
+    def _schedule(
+        self,
+        node: str,
+        listing: list[VMDetail | LXCDetail],
+        full_sync: bool,
+        changed: Collection[int],
+    ) -> list[tuple[VMDetail | LXCDetail, Future[Host] | Host]]:
+        scheduled: list[tuple[VMDetail | LXCDetail, Future[Host] | Host]] = []
+        for vm in listing:
+            host: Future[Host] | Host | None = None
+            if not full_sync:
+                host = self._unchanged_host(node, vm, changed)
+            if host is None:
+                host = self._submit(node, self._build_host, node, vm)
+            scheduled.append((vm, host))
+        return scheduled
+
+    def _collect(
+        self,
+        node: str,
+        scheduled: list[tuple[VMDetail | LXCDetail, Future[Host] | Host]],
+    ) -> dict[tuple[str, int], _GuestState]:
+        states: dict[tuple[str, int], _GuestState] = {}
+        for vm, result in scheduled:
+            host = self._wait(node, result) if isinstance(result, Future) else result
+            states[(host.pve_type, host.vmid)] = _GuestState(
+                _fingerprint(node, vm), vm.uptime or 0, host
+            )
+        return states
+
+    def _stale_hosts(self, node: str, error: Exception) -> list[Host]:
+        hosts = self._nodes.get(node, [])
+        reason = str(error).strip() or type(error).__name__
+        logger.warning(
+            f"node {node} failed, serving {len(hosts)} last known guests: {reason}"
+        )
+        stale = []
+        for host in hosts:
+            # copy, the cached host may be part of a published snapshot
+            host = replace(host, labels=dict(host.labels))
+            host.add_label("stale", "true")
+            stale.append(host)
+        return stale
+
+    def poll_events(self) -> set[int]:
+        """Return the vmids touched by guest tasks finished since the last poll.
+
+        They stay pending, and are re-fetched by every following refresh
+        until one of them covered their node.
+        """
+        try:
+            changed = self._tasks.changed(self.client.get_cluster_tasks())
+        except Exception as e:  # noqa
+            logger.warning(f"failed to poll cluster tasks: {e}")
+            return set()
+        TASK_EVENTS_TOTAL.inc(len(changed))
+        self._pending |= changed
+        return changed
+
+    def profile(self, session: ProfileSession | None) -> None:
+        """Sample and trace the next cycles into session, None to stop."""
+        self._profile = session
+
+    @PROPAGATION_TIME.time()
+    def discovery(self, changed: Collection[int] | None = None) -> Hosts:
+        """Discover all guests.
+
+        With changed, only these vmids, the ones still pending from earlier
+        task events and guests whose listing changed are re-fetched,
+        everything else is reused from the last cycle.
+        """
+        session = self._profile
+        if session is None or not session.active:
+            return self._discover(changed)
+        with session.cycle(self.cluster) as trace:
+            self.client.tracer = trace.record
             try:
-                vms = self._filer(self.client.get_all_vms(node))
-                containers = self._filer(self.client.get_all_containers(node))
-            except Exception as e:
-                raise APIError(str(e)) from e
-            for vm in vms + containers:
-                if vm.name:
-                    vmid = vm.vmid
-                    pve_type: Literal["qemu"] | Literal["container"] = cast(
-                        Literal["qemu"] | Literal["container"],
-                        ("qemu" if isinstance(vm, VMDetail) else "container"),
-                    )
-                    config = self.client.get_instance_config(node, pve_type, vmid)
-                    try:
-                        description = config["description"]
-                    except KeyError:
-                        description = None
-                    except Exception as e:  # noqa
-                        raise APIError(str(e)) from e
-                    ipv4_address, ipv6_address = self._get_ip_address(
-                        pve_type, node, vmid
-                    )
-                    host = Host(
-                        hostname=vm.name,
-                        ipv4_address=ipv4_address,
-                        ipv6_address=ipv6_address,
-                        vmid=vmid,
-                        pve_type=pve_type,
-                        labels={},
+                return self._discover(changed)
+            finally:
+                self.client.tracer = None
+
+    def _discover(self, changed: Collection[int] | None) -> Hosts:
+        # build a fresh Hosts every cycle, published snapshots must never change
+        hosts = Hosts([])
+        start = time.monotonic()
+        resynced: set[str] = set()
+        if changed is None and self.config.event_interval:
+            # this cycle sees everything up to now, only later tasks are events
+            self.poll_events()
+        self._clocks = {}
+        touched = self._pending | set(changed or ())
+        guests: dict[tuple[str, int], _GuestState] = {}
+        nodes: dict[str, list[Host]] = {}
+        failed: dict[str, Exception] = {}
+        with self.client.cycle():
+            # guest fetches of a node start as soon as its listing is done, results
+            # are collected in listing order so the output matches a sequential run
+            scheduled: dict[str, list[tuple[VMDetail | LXCDetail, Future[Host] | Host]]]
+            scheduled = {}
+            listings = self._listings()
+            for node, listing in self._wait_listings(listings):
+                full_sync = self._full_sync(node, changed, start)
+                if full_sync:
+                    resynced.add(node)
+                try:
+                    scheduled[node] = self._schedule(
+                        node, self._wait(node, listing), full_sync, touched
                     )
-                    config_flags = [
-                        ("cpu", "sockets"),
-                        ("cores", "cores"),
-                        ("memory", "memory"),
-                    ]
-                    for key, flag in config_flags:
-                        if flag in config:
-                            host.add_label(key, config[flag])
-                    host.add_label("status", vm.status)
-                    host.add_label("tags", vm.tags)
-                    self.hosts.add_host(host)
-        return self.hosts
-
-    def run(self) -> None:
-        while True:
-            self.discovery()
-            time.sleep(self.config.interval)
+                except Exception as e:  # noqa
+                    listing.cancel()
+                    failed[node] = e
+            fetched = sum(
+                isinstance(result, Future)
+                for entries in scheduled.values()
+                for _, result in entries
+            )
+            for node, _ in listings:
+                if node not in scheduled:
+                    continue
+                entries = scheduled[node]
+                try:
+                    states = self._collect(node, entries)
+                except Exception as e:  # noqa
+                    for _, result in entries:
+                        if isinstance(result, Future):
+                            result.cancel()
+                    failed[node] = e
+                    continue
+                guests.update(states)
+                nodes[node] = [state.host for state in states.values()]
+        NODE_ERRORS_TOTAL.inc(len(failed))
+        if listings and len(failed) == len(listings):
+            # an all-stale or empty list must not replace the last good snapshot
+            error = next(iter(failed.values()))
+            raise APIError(
+                f"all {len(listings)} nodes failed: "
+                f"{str(error).strip() or type(error).__name__}"
+            )
+        for node in failed:
+            # keep the last known guests so they are reused once the node is back
+            nodes[node] = self._nodes.get(node, [])
+            for host in nodes[node]:
+                key = (host.pve_type, host.vmid)
+                if key in self._guests:
+                    guests[key] = self._guests[key]
+        for node, _ in listings:
+            if node in failed:
+                node_hosts = self._stale_hosts(node, failed[node])
+            else:
+                node_hosts = nodes[node]
+            for host in node_hosts:
+                hosts.add_host(host)
+        logger.info(
+            f"fetched details for {fetched} of {len(guests)} guests, "
+            f"{len(failed)} of {len(listings)} nodes failed"
+        )
+        if failed:
+            # the guests of failed nodes are unknown, only drop the ones seen
+            self._pending -= {
+                vm.vmid
+                for node, entries in scheduled.items()
+                if node not in failed
+                for vm, _ in entries
+            }
+        else:
+            self._pending.clear()
+        for node in resynced - failed.keys():
+            self._synced[node] = start
+        for node in failed:
+            # whatever changed while the node was down is re-fetched once it is back
+            self._synced.pop(node, None)
+        self._guests = guests
+        self._nodes = nodes
+        self.hosts = hosts
+        return hosts
+
+    def restore(self, hosts: list[Host], age: float) -> None:
+        """Serve persisted hosts until the first successful refresh.
+
+        They also become the last known guests of their nodes, so nodes that
+        fail in the first cycles serve them as stale.
+        """
+        nodes: dict[str, list[Host]] = {}
+        for host in hosts:
+            nodes.setdefault(host.node, []).append(host)
+        self._nodes = nodes
+        snapshot = Snapshot.from_hosts(Hosts(hosts))
+        # age the snapshot so max_staleness also applies to the cache
+        self.snapshot = replace(snapshot, created_at=snapshot.created_at - age)
+
+    def refresh(self, changed: Collection[int] | None = None) -> Snapshot:
+        snapshot = Snapshot.from_hosts(self.discovery(changed), self.snapshot)
+        self.snapshot = snapshot
+        return snapshot
+
+    def try_refresh(self, changed: Collection[int] | None = None) -> Snapshot | None:
+        """Refresh, keeping the last good snapshot if discovery fails."""
+        try:
+            snapshot = self.refresh(changed)
+        except Exception as e:  # noqa
+            DISCOVERY_ERRORS_TOTAL.inc()
+            logger.error(f"discovery failed, keeping last good snapshot: {e}")
+            return None
+        logger.info(f"published snapshot with {len(snapshot.hosts)} hosts")
+        return snapshot
@@ -0,0 +1,74 @@
+from typing import Iterable
+
+from pphsd.pve_model import TaskDetail
+
+# tasks that create, remove, move or (re)start a guest or change its config
+GUEST_TASK_TYPES = frozenset(
+    {
+        "qmcreate",
+        "qmdestroy",
+        "qmclone",
+        "qmrestore",
+        "qmconfig",
+        "qmigrate",
+        "qmstart",
+        "qmstop",
+        "qmshutdown",
+        "qmreboot",
+        "qmsuspend",
+        "qmresume",
+        "vzcreate",
+        "vzdestroy",
+        "vzclone",
+        "vzrestore",
+        "vzmigrate",
+        "vzstart",
+        "vzstop",
+        "vzshutdown",
+        "vzreboot",
+        "vzsuspend",
+        "vzresume",
+        "hamigrate",
+        "hastart",
+        "hastop",
+    }
+)
+
+
+class TaskWatcher:
+    """Finds guests touched by tasks that finished since the last poll.
+
+    The cursor is the newest end time seen so far. /cluster/tasks only has
+    second resolution, so the tasks ending in that second are remembered to
+    not report them twice. Running tasks are picked up once they finish.
+    """
+
+    def __init__(self) -> None:
+        self._cursor: int | None = None
+        self._seen: set[str] = set()
+
+    def changed(self, tasks: Iterable[TaskDetail]) -> set[int]:
+        """Advance the cursor and return the vmids of new guest tasks.
+
+        The first call only sets the cursor, the full refresh it is part of
+        covers everything that happened before.
+        """
+        finished = [(task.endtime, task) for task in tasks if task.endtime is not None]
+        new = []
+        if self._cursor is not None:
+            new = [
+                task
+                for end, task in finished
+                if end > self._cursor
+                or (end == self._cursor and task.upid not in self._seen)
+            ]
+        cursor = max([end for end, _ in finished] + [self._cursor or 0])
+        if cursor != self._cursor:
+            self._seen = set()
+        self._cursor = cursor
+        self._seen.update(task.upid for end, task in finished if end == cursor)
+        return {
+            int(task.id)
+            for task in new
+            if task.type in GUEST_TASK_TYPES and task.id and task.id.isdigit()
+        }
@@ -0,0 +1,76 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, TypeVar
+
+from loguru import logger
+
+T = TypeVar("T")
+
+
+class FetchEngine:
+    """Bounded-concurrency executor for PVE API calls.
+
+    The pool size caps the number of requests in flight globally, and a
+    per-node limit caps how many of them may target a single node at once.
+    Work over a node's limit waits in a queue for that node instead of
+    occupying a pool thread, so one slow node cannot starve the others.
+    """
+
+    def __init__(self, max_workers: int, max_per_node: int):
+        logger.debug(
+            f"starting fetch engine with {max_workers} workers, "
+            f"{max_per_node} per node"
+        )
+        self.max_per_node = max(1, max_per_node)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="pphsd-fetch"
+        )
+        self._running: dict[str, int] = {}
+        self._queued: dict[str, deque[tuple[Future[Any], Callable[[], Any]]]] = {}
+        self._lock = Lock()
+
+    def _run(self, node: str, future: Future[Any], call: Callable[[], Any]) -> None:
+        try:
+            future.set_result(call())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            self._release(node)
+
+    def _release(self, node: str) -> None:
+        # hand the node's slot to its next queued call that was not cancelled
+        with self._lock:
+            queue = self._queued[node]
+            while queue:
+                future, call = queue.popleft()
+                if future.set_running_or_notify_cancel():
+                    break
+            else:
+                self._running[node] -= 1
+                return
+        self._executor.submit(self._run, node, future, call)
+
+    def submit(self, node: str, fn: Callable[..., T], *args: Any) -> Future[T]:
+        """Schedule fn(*args) against node, honouring both limits.
+
+        Calls still waiting for a node slot can be dropped with cancel().
+        """
+        future: Future[T] = Future()
+
+        def call() -> T:
+            return fn(*args)
+
+        with self._lock:
+            queue = self._queued.setdefault(node, deque())
+            running = self._running.get(node, 0)
+            if running >= self.max_per_node:
+                queue.append((future, call))
+                return future
+            self._running[node] = running + 1
+        future.set_running_or_notify_cancel()
+        self._executor.submit(self._run, node, future, call)
+        return future
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
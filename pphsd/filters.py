@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from pphsd.config import Config
+from pphsd.model import split_tags
+from pphsd.pve_model import LXCDetail, VMDetail
+
+Predicate = Callable[[VMDetail | LXCDetail], bool]
+
+
+def _pools(names: Iterable[str]) -> frozenset[str]:
+    return frozenset(name for name in names if name)
+
+
+@dataclass(frozen=True)
+class GuestFilter:
+    """Include and exclude rules compiled once from the config.
+
+    Node rules are checked before a node is listed, guest rules right after
+    listing, so excluded guests never cost a config or agent request.
+    """
+
+    include_nodes: frozenset[str]
+    exclude_nodes: frozenset[str]
+    include_pools: frozenset[str]
+    exclude_pools: frozenset[str]
+    predicates: tuple[Predicate, ...]
+
+    @classmethod
+    def from_config(cls, config: Config) -> "GuestFilter":
+        include_vmid = frozenset(config.include_vmid)
+        exclude_vmid = frozenset(config.exclude_vmid)
+        include_tags = frozenset(config.include_tags)
+        exclude_tags = frozenset(config.exclude_tags)
+        exclude_state = frozenset(config.exclude_state)
+        include_pools = _pools(config.include_pools)
+        exclude_pools = _pools(config.exclude_pools)
+
+        # cheapest checks first, only configured rules get a predicate
+        predicates: list[Predicate] = [
+            lambda vm: bool(vm.name),
+            lambda vm: not (isinstance(vm, VMDetail) and vm.template == 1),
+        ]
+        if include_vmid:
+            predicates.append(lambda vm: vm.vmid in include_vmid)
+        if exclude_vmid:
+            predicates.append(lambda vm: vm.vmid not in exclude_vmid)
+        if exclude_state:
+            predicates.append(lambda vm: vm.status.value not in exclude_state)
+        if include_pools:
+            predicates.append(lambda vm: vm.pool in include_pools)
+        if exclude_pools:
+            predicates.append(lambda vm: vm.pool not in exclude_pools)
+        if include_tags:
+            predicates.append(
+                lambda vm: not include_tags.isdisjoint(split_tags(vm.tags))
+            )
+        if exclude_tags:
+            predicates.append(lambda vm: exclude_tags.isdisjoint(split_tags(vm.tags)))
+        return cls(
+            include_nodes=frozenset(config.include_nodes),
+            exclude_nodes=frozenset(config.exclude_nodes),
+            include_pools=include_pools,
+            exclude_pools=exclude_pools,
+            predicates=tuple(predicates),
+        )
+
+    @property
+    def pools(self) -> frozenset[str]:
+        """Pools whose membership the guest rules need."""
+        return self.include_pools | self.exclude_pools
+
+    def node_allowed(self, node: str) -> bool:
+        if self.include_nodes and node not in self.include_nodes:
+            return False
+        return node not in self.exclude_nodes
+
+    def matches(self, vm: VMDetail | LXCDetail) -> bool:
+        return all(predicate(vm) for predicate in self.predicates)
+
+    def apply(
+        self, guests: Iterable[VMDetail | LXCDetail]
+    ) -> list[VMDetail | LXCDetail]:
+        return [vm for vm in guests if self.matches(vm)]
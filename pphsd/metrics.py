@@ -1,4 +1,4 @@
-from prometheus_client import Gauge, Summary, Counter
+from prometheus_client import Gauge, Summary, Counter, Histogram
 
 PROPAGATION_TIME = Summary(
     "pve_sd_propagate_seconds", "Time spent propagating the inventory from PVE"
@@ -10,3 +10,43 @@ PVE_REQUEST_COUNT_TOTAL = Counter(
 PVE_REQUEST_COUNT_ERROR_TOTAL = Counter(
     "pve_sd_requests_error_total", "Total count of failed requests to PVE API"
 )
+PVE_REQUEST_CACHE_HITS_TOTAL = Counter(
+    "pve_sd_request_cache_hits_total",
+    "Total count of PVE API reads served from the per-cycle cache",
+)
+PVE_REQUEST_CACHE_MISSES_TOTAL = Counter(
+    "pve_sd_request_cache_misses_total",
+    "Total count of PVE API reads not found in the per-cycle cache",
+)
+AGENT_CACHE_HITS_TOTAL = Counter(
+    "pve_sd_agent_cache_hits_total",
+    "Total count of guest agent lookups served from the agent cache",
+)
+AGENT_CACHE_MISSES_TOTAL = Counter(
+    "pve_sd_agent_cache_misses_total",
+    "Total count of guest agent lookups that had to query PVE",
+)
+DISCOVERY_ERRORS_TOTAL = Counter(
+    "pve_sd_discovery_errors_total", "Total count of failed discovery cycles"
+)
+NODE_ERRORS_TOTAL = Counter(
+    "pve_sd_node_errors_total",
+    "Total count of nodes that failed or timed out and served stale guests",
+)
+TASK_EVENTS_TOTAL = Counter(
+    "pve_sd_task_events_total",
+    "Total count of guests refreshed because of a finished PVE task",
+)
+DISCOVERY_PHASE_SECONDS = Histogram(
+    "pve_sd_discovery_phase_seconds",
+    "Time spent per discovery step, by phase (listing, config, agent)",
+    ["phase"],
+)
+PVE_REQUEST_SECONDS = Histogram(
+    "pve_sd_request_seconds",
+    "Latency of requests to PVE API, by endpoint",
+    ["endpoint"],
+)
+PVE_REQUESTS_IN_FLIGHT = Gauge(
+    "pve_sd_requests_in_flight", "Number of requests to PVE API in flight"
+)
@@ -1,9 +1,44 @@
-from typing import Optional
+import re
+import sys
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
 
-from pydantic import dataclasses
+_LABEL_KEYS: dict[str, str] = {}
+# PVE accepts ";", "," and spaces between tags, and stores them with ";"
+_TAG_SEPARATORS = re.compile(r"[;,\s]+")
 
+# what /targets can be filtered by, see Hosts.select
+SELECTORS = ("cluster", "node", "type", "status", "tag")
 
-@dataclasses.dataclass
+HostKey = tuple[str, str, int]
+
+
+def label_key(key: str) -> str:
+    """Return the interned __meta_pve_ label name for key."""
+    label = _LABEL_KEYS.get(key)
+    if label is None:
+        label = sys.intern("__meta_pve_" + key.replace("-", "_").replace(" ", "_"))
+        _LABEL_KEYS[key] = label
+    return label
+
+
+_IPV4_LABEL = label_key("ipv4")
+_IPV6_LABEL = label_key("ipv6")
+_NAME_LABEL = label_key("name")
+_TYPE_LABEL = label_key("type")
+_VMID_LABEL = label_key("vmid")
+_CLUSTER_LABEL = label_key("cluster")
+_NODE_LABEL = label_key("node")
+_TAGS_LABEL = label_key("tags")
+
+
+def split_tags(tags: str | None) -> frozenset[str]:
+    if not tags:
+        return frozenset()
+    return frozenset(tag for tag in _TAG_SEPARATORS.split(tags) if tag)
+
+
+@dataclass(slots=True)
 class Host:
     hostname: str
     ipv4_address: Optional[str]
@@ -11,6 +46,10 @@ class Host:
     vmid: int
     pve_type: str
     labels: dict[str, str]
+    cluster: str = ""
+    node: str = ""
+    # the plain guest status, e.g. "running"
+    status: str = ""
 
     def __str__(self):
         return (
@@ -19,48 +58,105 @@ class Host:
         )
 
     def add_label(self, key, value):
-        key = key.replace("-", "_").replace(" ", "_")
-        self.labels[f"__meta_pve_{key}"] = str(value)
+        self.labels[label_key(key)] = str(value)
 
     def __post_init__(self):
-        self.add_label("ipv4", self.ipv4_address)
-        self.add_label("ipv6", self.ipv6_address)
-        self.add_label("name", self.hostname)
-        self.add_label("type", self.pve_type)
-        self.add_label("vmid", self.vmid)
+        labels = self.labels
+        labels[_IPV4_LABEL] = str(self.ipv4_address)
+        labels[_IPV6_LABEL] = str(self.ipv6_address)
+        labels[_NAME_LABEL] = self.hostname
+        labels[_TYPE_LABEL] = self.pve_type
+        labels[_VMID_LABEL] = str(self.vmid)
+        if self.cluster:
+            labels[_CLUSTER_LABEL] = self.cluster
+        if self.node:
+            labels[_NODE_LABEL] = self.node
+
+    @property
+    def key(self) -> HostKey:
+        return self.cluster, self.pve_type, self.vmid
+
+    def selector_values(self) -> Iterator[tuple[str, str]]:
+        yield "cluster", self.cluster
+        yield "node", self.node
+        yield "type", self.pve_type
+        yield "status", self.status
+        for tag in split_tags(self.labels.get(_TAGS_LABEL)):
+            yield "tag", tag
 
     def to_sd_json(self):
         return {"targets": [self.hostname], "labels": self.labels}
 
 
-@dataclasses.dataclass
 class Hosts:
-    hosts: list[Host]
+    """Hosts in insertion order, indexed by (cluster, pve_type, vmid).
 
-    def __eq__(self, other: object) -> bool:
-        if not isinstance(other, self.__class__):
-            return False
+    Secondary indexes map each selector value to the keys of its hosts, also
+    in insertion order, so selections never scan all hosts. They are built on
+    the first selection, most inventories are only ever served whole.
+    """
 
-        if len(other.hosts) != len(self.hosts):
-            return False
+    def __init__(self, hosts: Iterable[Host] = ()):
+        self._index: dict[HostKey, Host] = {}
+        self._selectors: dict[tuple[str, str], dict[HostKey, None]] | None = None
+        for host in hosts:
+            self.add_host(host)
+
+    @property
+    def hosts(self) -> list[Host]:
+        return list(self._index.values())
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[Host]:
+        return iter(self._index.values())
 
-        for host in self.hosts:
-            if other.host_exists(host):
-                continue
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, self.__class__):
             return False
 
-        return True
+        return self._index.keys() == other._index.keys()
 
     def clear(self):
-        self.hosts = []
+        self._index = {}
+        self._selectors = None
 
     def add_host(self, host: Host):
-        if not self.host_exists(host):
-            self.hosts.append(host)
+        if host.key not in self._index:
+            self._index[host.key] = host
+            self._selectors = None
+
+    def _selector_index(self) -> dict[tuple[str, str], dict[HostKey, None]]:
+        selectors = self._selectors
+        if selectors is None:
+            # built aside and published at once, concurrent readers at worst
+            # build it twice
+            selectors = {}
+            for key, host in self._index.items():
+                for selector in host.selector_values():
+                    selectors.setdefault(selector, {})[key] = None
+            self._selectors = selectors
+        return selectors
+
+    def select(self, **selectors: str) -> list[Host]:
+        """Hosts matching all selectors, e.g. select(node="pve1", tag="web")."""
+        if not selectors:
+            return self.hosts
+        selector_index = self._selector_index()
+        indexes = sorted(
+            (selector_index.get(selector, {}) for selector in selectors.items()),
+            key=len,
+        )
+        # walk the smallest index, it keeps the insertion order
+        smallest, rest = indexes[0], indexes[1:]
+        return [
+            self._index[key] for key in smallest if all(key in index for index in rest)
+        ]
+
+    def get_host(self, pve_type: str, vmid: int, cluster: str = "") -> Host | None:
+        return self._index.get((cluster, pve_type, vmid))
 
     def host_exists(self, host: Host) -> bool:
-        """Check if a host is already in the list by id and type."""
-        for current in self.hosts:
-            if current.pve_type == host.pve_type and current.vmid == host.vmid:
-                return True
-        return False
+        """Check if a host is already in the list by cluster, id and type."""
+        return host.key in self._index
@@ -0,0 +1,179 @@
+import concurrent.futures.thread
+import contextlib
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+from typing import Any, Callable, Iterator, NamedTuple, ParamSpec, TypeVar
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# seconds between two stack samples
+SAMPLE_INTERVAL = 0.005
+# frames of the thread pools every sample passes through, left out of reports
+_PLUMBING = frozenset(
+    (
+        threading.__file__,
+        concurrent.futures.thread.__file__,
+        contextlib.__file__,
+        __file__,
+    )
+)
+
+
+class RequestTrace(NamedTuple):
+    path: str
+    seconds: float
+    # bytes of the response as JSON, 0 for failed requests
+    size: int
+    error: str | None
+
+
+@dataclass
+class CycleTrace:
+    cluster: str
+    started: float = field(default_factory=time.time)
+    seconds: float = 0.0
+    requests: list[RequestTrace] = field(default_factory=list)
+
+    def record(
+        self, path: str, seconds: float, response: Any, error: Exception | None
+    ) -> None:
+        size = 0
+        if error is None:
+            size = len(json.dumps(response, separators=(",", ":")))
+        # list.append is atomic, requests are recorded from all workers
+        self.requests.append(
+            RequestTrace(path, seconds, size, str(error) if error else None)
+        )
+
+
+def _function(code: Any) -> str:
+    return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+
+class ProfileSession:
+    """Samples the stacks of the threads working on the next discovery cycles.
+
+    A sampler instead of cProfile, which only sees the thread that enabled
+    it, while a cycle is spread over the fetch engine's workers. Only threads
+    inside a cycle or a task wrapped by this session are sampled.
+    """
+
+    def __init__(self, cycles: int, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.remaining = cycles
+        self.cycles: list[CycleTrace] = []
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._threads: Counter[int] = Counter()
+        self._own: Counter[str] = Counter()
+        self._cumulative: Counter[str] = Counter()
+        self._samples = 0
+        self._sampler: threading.Thread | None = None
+
+    @property
+    def active(self) -> bool:
+        return not self.done.is_set()
+
+    @contextmanager
+    def _sampled(self) -> Iterator[None]:
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] += 1
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads[ident] -= 1
+                if not self._threads[ident]:
+                    del self._threads[ident]
+
+    def wrap(self, fn: Callable[P, R]) -> Callable[P, R]:
+        """Sample the thread that runs fn while it runs."""
+
+        @wraps(fn)
+        def sampled(*args: P.args, **kwargs: P.kwargs) -> R:
+            with self._sampled():
+                return fn(*args, **kwargs)
+
+        return sampled
+
+    @contextmanager
+    def cycle(self, cluster: str) -> Iterator[CycleTrace]:
+        trace = CycleTrace(cluster)
+        start = time.perf_counter()
+        try:
+            with self._sampled():
+                yield trace
+        finally:
+            trace.seconds = time.perf_counter() - start
+            with self._lock:
+                self.cycles.append(trace)
+                self.remaining -= 1
+                if self.remaining <= 0:
+                    self.done.set()
+
+    def close(self) -> None:
+        """Stop sampling, waiting for the sampler so report() sees all samples."""
+        self.done.set()
+        with self._lock:
+            sampler = self._sampler
+        if sampler is not None:
+            sampler.join()
+
+    def _sample(self) -> None:
+        while not self.done.wait(self.interval):
+            with self._lock:
+                idents = list(self._threads)
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                self._own[_function(frame.f_code)] += 1
+                seen = set()
+                while frame is not None:
+                    if frame.f_code.co_filename not in _PLUMBING:
+                        seen.add(_function(frame.f_code))
+                    frame = frame.f_back
+                self._cumulative.update(seen)
+            self._samples += 1
+
+    def report(self, limit: int = 30) -> dict[str, Any]:
+        """Per-cycle request traces and the functions most samples were in.
+
+        Times are summed over all sampled threads, so a function running in
+        several workers at once can take longer than the cycle itself.
+        """
+        functions = [
+            {
+                "function": function,
+                "own": self._own[function] * self.interval,
+                "cumulative": samples * self.interval,
+            }
+            for function, samples in self._cumulative.most_common(limit)
+        ]
+        return {
+            "complete": self.remaining <= 0,
+            "cycles": [
+                {
+                    **asdict(cycle),
+                    "requests": [request._asdict() for request in cycle.requests],
+                }
+                for cycle in self.cycles
+            ],
+            "profile": {
+                "interval": self.interval,
+                "samples": self._samples,
+                "functions": functions,
+            },
+        }
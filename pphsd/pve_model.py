@@ -49,6 +49,8 @@ class VMDetail(BaseModel):
     uptime: Optional[int]
     template: Optional[int] = Field(default=0)
     description: Optional[str] = Field(default_factory=str)
+    node: Optional[str] = Field(default_factory=str)
+    pool: Optional[str] = Field(default=None)
 
 
 class LXCDetail(BaseModel):
@@ -63,6 +65,8 @@ class LXCDetail(BaseModel):
     tags: Optional[str]
     uptime: Optional[int]
     description: Optional[str] = Field(default_factory=str)
+    node: Optional[str] = Field(default_factory=str)
+    pool: Optional[str] = Field(default=None)
 
 
 # Network Interface config from Proxmox API
@@ -88,3 +92,14 @@ class NetworkInterfaceConfig(BaseModel):
     name: str
     ip_addresses: list[IPAddress] = Field(alias="ip-addresses", default_factory=list)
     statistics: Optional[Statistics]
+
+
+class TaskDetail(BaseModel):
+    upid: str
+    node: str
+    type: str
+    id: Optional[str] = Field(default_factory=str)
+    user: Optional[str] = Field(default_factory=str)
+    starttime: int
+    endtime: Optional[int] = Field(default=None)
+    status: Optional[str] = Field(default_factory=str)
@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Sequence
+
+from loguru import logger
+
+from pphsd.config import Config
+from pphsd.discovery import Discovery
+from pphsd.exceptions import ConfigError
+from pphsd.fetcher import FetchEngine
+from pphsd.metrics import HOST_GAUGE
+from pphsd.model import Host, Hosts
+from pphsd.profiling import ProfileSession
+from pphsd.snapshot import Snapshot
+from pphsd.store import load_hosts, save_hosts, touch
+
+
+def _same(snapshots: Sequence[Snapshot], merged: Sequence[Snapshot]) -> bool:
+    # by identity, equal snapshots would compare all their hosts
+    return len(snapshots) == len(merged) and all(
+        snapshot is other for snapshot, other in zip(snapshots, merged)
+    )
+
+
+class Scheduler:
+    """Refreshes every configured cluster and publishes one merged snapshot.
+
+    Clusters refresh concurrently and share one fetch engine, so max_workers
+    caps the requests in flight across the whole process. Their refreshes
+    are staggered over the interval instead of all hitting PVE at once.
+    """
+
+    def __init__(self, config: Config):
+        pve_configs = config.pve_configs()
+        names = [pve_config.name for pve_config in pve_configs]
+        if len(pve_configs) > 1 and (not all(names) or len(set(names)) != len(names)):
+            raise ConfigError("every cluster needs a unique name")
+        self.config = config
+        self.engine = FetchEngine(config.max_workers, config.max_requests_per_node)
+        self.discoveries = [
+            Discovery(config, self.engine, pve_config) for pve_config in pve_configs
+        ]
+        self.snapshot: Snapshot | None = None
+        # etag of the hosts in the cache file
+        self._saved: str | None = None
+        self._profiling = threading.Lock()
+        self._publishing = threading.Lock()
+        # the cluster snapshots self.snapshot was last merged from
+        self._merged: tuple[Snapshot, ...] = ()
+        if config.cache_file:
+            self._restore()
+
+    def _restore(self) -> None:
+        """Serve the persisted hosts until the first refresh of each cluster."""
+        loaded = load_hosts(self.config.cache_file)
+        if loaded is None:
+            return
+        hosts, age = loaded
+        clusters: dict[str, list[Host]] = defaultdict(list)
+        for host in hosts:
+            clusters[host.cluster].append(host)
+        for discovery in self.discoveries:
+            if discovery.cluster in clusters:
+                discovery.restore(clusters[discovery.cluster], age)
+        # no need to write back what was just read
+        published = self._publish(persist=False)
+        if published is not None:
+            logger.info(
+                f"serving {len(published.hosts)} cached hosts from "
+                f"{self.config.cache_file}, {age:.0f}s old"
+            )
+
+    def _save(self, snapshot: Snapshot) -> None:
+        try:
+            if snapshot.etag == self._saved:
+                touch(self.config.cache_file)
+            else:
+                save_hosts(self.config.cache_file, snapshot.hosts)
+        except OSError as e:
+            logger.warning(f"failed to write cache {self.config.cache_file}: {e}")
+            self._saved = None
+            return
+        self._saved = snapshot.etag
+
+    def _publish(self, persist: bool) -> Snapshot | None:
+        """Merge the clusters' snapshots, persisting the result with persist.
+
+        Only persist after a successful refresh, the cache file's mtime is
+        when its hosts were last confirmed.
+        """
+        # clusters refresh on their own threads
+        with self._publishing:
+            return self._merge(persist)
+
+    def _merge(self, persist: bool) -> Snapshot | None:
+        snapshots = []
+        for discovery in self.discoveries:
+            snapshot = discovery.snapshot
+            if snapshot is None:
+                continue
+            if self.config.max_staleness and snapshot.age > self.config.max_staleness:
+                logger.warning(
+                    f"dropping stale snapshot of cluster {discovery.cluster}"
+                )
+                continue
+            snapshots.append(snapshot)
+        if len(self.discoveries) == 1:
+            self.snapshot = self.discoveries[0].snapshot
+        elif snapshots and not _same(snapshots, self._merged):
+            # clusters publish after every poll, most of them refreshed nothing
+            hosts = Hosts(host for snapshot in snapshots for host in snapshot.hosts)
+            self.snapshot = Snapshot.from_hosts(hosts, self.snapshot)
+            self._merged = tuple(snapshots)
+        if self.snapshot is None:
+            return None
+        # the hosts served across all clusters
+        HOST_GAUGE.set(len(self.snapshot.hosts))
+        if self.config.cache_file and persist:
+            self._save(self.snapshot)
+        return self.snapshot
+
+    def refresh(self) -> Snapshot | None:
+        """Refresh all clusters at once and publish the merged result."""
+        with ThreadPoolExecutor(len(self.discoveries)) as executor:
+            refreshed = list(executor.map(Discovery.try_refresh, self.discoveries))
+        return self._publish(persist=any(refreshed))
+
+    def profile(self, cycles: int, timeout: float) -> ProfileSession | None:
+        """Profile the next cycles of any cluster, waiting up to timeout.
+
+        Returns None while another profile is running.
+        """
+        if not self._profiling.acquire(blocking=False):
+            return None
+        session = ProfileSession(cycles)
+        try:
+            for discovery in self.discoveries:
+                discovery.profile(session)
+            session.done.wait(timeout)
+        finally:
+            for discovery in self.discoveries:
+                discovery.profile(None)
+            session.close()
+            self._profiling.release()
+        return session
+
+    def _poll(self, discovery: Discovery) -> bool:
+        """Refresh the guests touched by tasks, True if that succeeded."""
+        changed = discovery.poll_events()
+        if not changed:
+            return False
+        logger.info(
+            f"refreshing cluster {discovery.cluster or 'default'} after tasks "
+            f"on guests {sorted(changed)}"
+        )
+        return discovery.try_refresh(changed) is not None
+
+    def _run_cluster(self, discovery: Discovery, offset: float) -> None:
+        interval = self.config.interval
+        event_interval = self.config.event_interval
+        due = time.monotonic() + offset
+        # the first poll happens in the first refresh, the task list is only
+        # watched between full refreshes
+        poll = due + event_interval if event_interval else float("inf")
+        while True:
+            delay = min(due, poll) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if due <= poll:
+                refreshed = discovery.try_refresh() is not None
+                due = time.monotonic() + interval
+            else:
+                refreshed = self._poll(discovery)
+            if event_interval:
+                poll = time.monotonic() + event_interval
+            self._publish(persist=refreshed)
+
+    def run(self) -> None:
+        # every cluster runs on its own thread, so a slow or unreachable one
+        # never holds back the others, the shared engine caps their requests
+        threads = [
+            threading.Thread(
+                target=self._run_cluster,
+                # spread the first refresh of each cluster evenly over one interval
+                args=(discovery, self.config.interval * index / len(self.discoveries)),
+                name=f"pphsd-cluster-{discovery.cluster or 'default'}",
+                daemon=True,
+            )
+            for index, discovery in enumerate(self.discoveries)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,96 @@
+from flask import Flask, Response, jsonify, request
+from loguru import logger
+
+from pphsd.config import Config
+from pphsd.model import SELECTORS
+from pphsd.scheduler import Scheduler
+
+
+def create_app(config: Config, scheduler: Scheduler) -> Flask:
+    app = Flask(__name__)
+
+    @app.route("/targets")
+    def targets() -> Response:
+        snapshot = scheduler.snapshot
+        if snapshot is None:
+            return Response("discovery has not completed yet", status=503)
+        if config.max_staleness and snapshot.age > config.max_staleness:
+            return Response(
+                f"last good snapshot is {snapshot.age:.0f}s old", status=503
+            )
+        selectors = request.args.to_dict()
+        unknown = selectors.keys() - SELECTORS
+        if unknown:
+            return Response(
+                f"unknown selectors {sorted(unknown)}, use {list(SELECTORS)}",
+                status=400,
+            )
+        view = snapshot.view(**selectors)
+        etag, payload = view.etag, view.payload
+        headers = {"Vary": "Accept-Encoding"}
+        if request.accept_encodings["gzip"]:
+            # a strong validator has to differ between content codings
+            etag, payload = f"{view.etag}-gzip", view.gzip_payload
+            headers["Content-Encoding"] = "gzip"
+        headers["ETag"] = f'"{etag}"'
+        if request.if_none_match.contains_weak(etag):
+            headers.pop("Content-Encoding", None)
+            return Response(status=304, headers=headers)
+        return Response(payload, mimetype="application/json", headers=headers)
+
+    if config.admin_enabled:
+
+        @app.route("/debug/profile")
+        def profile() -> Response:
+            cycles = request.args.get("cycles", 1, type=int)
+            limit = request.args.get("limit", 30, type=int)
+            if not 1 <= cycles <= config.admin_max_cycles:
+                return Response(
+                    f"cycles must be between 1 and {config.admin_max_cycles}",
+                    status=400,
+                )
+            # a cycle starts at the latest one interval from now
+            max_timeout = float(
+                config.admin_max_cycles * config.interval + config.node_timeout
+            )
+            timeout = request.args.get(
+                "timeout",
+                float(cycles * config.interval + config.node_timeout),
+                type=float,
+            )
+            if not 0 < timeout <= max_timeout:
+                return Response(
+                    f"timeout must be between 0 and {max_timeout:.0f}", status=400
+                )
+            logger.info(f"profiling the next {cycles} discovery cycles")
+            session = scheduler.profile(cycles, timeout)
+            if session is None:
+                return Response("a profile is already running", status=409)
+            return jsonify(session.report(limit))
+
+    return app
+
+
+def serve(config: Config, app: Flask) -> None:
+    """Serve app with the configured server, all threads share one process."""
+    if config.http_server == "waitress":
+        try:
+            import waitress
+        except ImportError:
+            logger.warning("waitress is not installed, using the flask server")
+        else:
+            logger.info(
+                f"serving on {config.http_address}:{config.http_port} "
+                f"with waitress, {config.http_threads} threads"
+            )
+            waitress.serve(
+                app,
+                host=config.http_address,
+                port=config.http_port,
+                threads=config.http_threads,
+                connection_limit=config.http_connection_limit,
+                channel_timeout=config.http_keepalive_timeout,
+                ident="pphsd",
+            )
+            return
+    app.run(host=config.http_address, port=config.http_port, threaded=True)
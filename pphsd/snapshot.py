@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, NamedTuple
+
+from pphsd.model import Host, Hosts
+
+# selections cached per snapshot, any further ones are serialized per request
+MAX_VIEWS = 256
+
+
+def content_hash(payload: bytes) -> str:
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+class View(NamedTuple):
+    payload: bytes
+    gzip_payload: bytes
+    etag: str
+
+
+def _dumps(hosts: Iterable[Host]) -> bytes:
+    return json.dumps(
+        [host.to_sd_json() for host in hosts], separators=(",", ":")
+    ).encode()
+
+
+def _compress(payload: bytes) -> bytes:
+    # a fixed mtime keeps the compressed body stable for equal payloads
+    return gzip.compress(payload, mtime=0)
+
+
+def serialize(hosts: Iterable[Host]) -> View:
+    payload = _dumps(hosts)
+    return View(payload, _compress(payload), content_hash(payload))
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """An immutable, pre-serialized discovery result ready to be served."""
+
+    hosts: Hosts
+    payload: bytes
+    gzip_payload: bytes
+    etag: str
+    created_at: float = field(default_factory=time.monotonic)
+    # serialized selections by their sorted selectors
+    views: dict[tuple[tuple[str, str], ...], View] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+
+    @classmethod
+    def from_hosts(cls, hosts: Hosts, previous: "Snapshot | None" = None) -> "Snapshot":
+        """Serialize hosts, keeping the bodies and views of an equal previous snapshot.
+
+        Every selector is also a label, so an equal payload means equal views.
+        """
+        payload = _dumps(hosts)
+        etag = content_hash(payload)
+        if previous and previous.etag == etag:
+            # compressing is most of the cost, skip it for unchanged hosts
+            payload, gzip_payload = previous.payload, previous.gzip_payload
+            views = previous.views
+        else:
+            gzip_payload = _compress(payload)
+            views = {}
+        return cls(
+            hosts=hosts,
+            payload=payload,
+            gzip_payload=gzip_payload,
+            etag=etag,
+            views=views,
+        )
+
+    def view(self, **selectors: str) -> View:
+        """The hosts matching all selectors, serialized once per snapshot."""
+        if not selectors:
+            return View(self.payload, self.gzip_payload, self.etag)
+        key = tuple(sorted(selectors.items()))
+        view = self.views.get(key)
+        if view is None:
+            view = serialize(self.hosts.select(**selectors))
+            if len(self.views) < MAX_VIEWS:
+                self.views[key] = view
+        return view
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict
+
+from loguru import logger
+
+from pphsd.model import Host, Hosts
+
+CACHE_VERSION = 1
+
+
+def write_atomic(path: str, payload: bytes, mode: int) -> None:
+    # the temp file lives next to the target so os.replace is an atomic rename
+    fd, temp_name = tempfile.mkstemp(
+        prefix=".prometheus-pve-sd", dir=os.path.dirname(os.path.abspath(path))
+    )
+    try:
+        with os.fdopen(fd, "wb") as tf:
+            tf.write(payload)
+        os.chmod(temp_name, mode)
+        os.replace(temp_name, path)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+
+def save_hosts(path: str, hosts: Hosts) -> None:
+    """Persist hosts so a restarted process can serve them right away."""
+    document = {"version": CACHE_VERSION, "hosts": [asdict(host) for host in hosts]}
+    write_atomic(path, json.dumps(document, separators=(",", ":")).encode(), 0o600)
+
+
+def touch(path: str) -> None:
+    """Mark persisted hosts as still current."""
+    os.utime(path)
+
+
+def load_hosts(path: str) -> tuple[Hosts, float] | None:
+    """Load persisted hosts and their age in seconds, None if there are none.
+
+    The age is taken from the file's mtime, which is bumped by every refresh
+    that confirmed the hosts.
+    """
+    try:
+        with open(path, "rb") as f:
+            age = max(0.0, time.time() - os.fstat(f.fileno()).st_mtime)
+            document = json.load(f)
+        if document.get("version") != CACHE_VERSION:
+            logger.warning(f"ignoring inventory cache {path}: unknown version")
+            return None
+        hosts = Hosts(Host(**entry) for entry in document["hosts"])
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.warning(f"ignoring inventory cache {path}: {e}")
+        return None
+    return hosts, age